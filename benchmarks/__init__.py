@@ -0,0 +1,8 @@
+"""
+Benchmarks for HGNpyhop: random problem generators for the logistics and
+satellite domains (benchmarks.generators) and a runner that measures the
+planner on them across problem sizes (benchmarks.run).
+
+Run from the repository root, e.g.:
+    python -m benchmarks.run --domain logistics --sizes 5,10,20 --output bench_output.txt
+"""
@@ -0,0 +1,92 @@
+"""
+Random problem generators. Each generator returns a (state, goals) pair
+for the corresponding domain; the same arguments and seed always give the
+same problem.
+"""
+
+import random
+import hgn_pyhop
+
+
+def logistics_problem(packages, cities, trucks=None, planes=1, locations=3, seed=0):
+    """
+    A logistics problem with the given numbers of packages, cities, trucks
+    and planes, and of locations per city (one of which is the airport of
+    the city). Every city has at least one truck, so every package can be
+    delivered; each package starts and ends at random locations.
+    """
+    rng = random.Random(seed)
+    trucks = max(trucks or cities, cities)
+    state = hgn_pyhop.State('logistics-{}-{}'.format(packages, cities))
+    state.packages = {'package{}'.format(i) for i in range(packages)}
+    state.trucks = {'truck{}'.format(i) for i in range(trucks)}
+    state.airplanes = {'plane{}'.format(i) for i in range(planes)}
+    state.cities = {'city{}'.format(i) for i in range(cities)}
+    state.in_city = {}
+    city_locations = []
+    for c in range(cities):
+        names = ['airport{}'.format(c)] + ['location{}_{}'.format(c, i) for i in range(1, locations)]
+        for name in names:
+            state.in_city[name] = 'city{}'.format(c)
+        city_locations.append(names)
+    state.locations = set(state.in_city)
+    state.airports = {names[0] for names in city_locations}
+    all_locations = sorted(state.locations)
+    state.at = {}
+    for i in range(trucks):
+        state.at['truck{}'.format(i)] = rng.choice(city_locations[i % cities])
+    for i in range(planes):
+        state.at['plane{}'.format(i)] = rng.choice(sorted(state.airports))
+    goals = []
+    for i in range(packages):
+        state.at['package{}'.format(i)] = rng.choice(all_locations)
+        goals.append(('at', 'package{}'.format(i), rng.choice(all_locations)))
+    return state, goals
+
+
+def satellite_problem(satellites, instruments, directions, images, modes=3, seed=0):
+    """
+    A satellite problem with the given numbers of satellites, instruments
+    (spread over the satellites), directions and images to take. Every mode
+    is supported by at least one instrument.
+    """
+    rng = random.Random(seed)
+    state = hgn_pyhop.State('satellite-{}-{}'.format(satellites, instruments))
+    state.satellites = {'satellite{}'.format(i) for i in range(satellites)}
+    state.instruments = {'instrument{}'.format(i) for i in range(instruments)}
+    state.modes = {'mode{}'.format(i) for i in range(modes)}
+    state.directions = {'direction{}'.format(i) for i in range(directions)}
+    state.power_avail = dict((s, True) for s in state.satellites)
+    state.pointing = dict((s, 'direction{}'.format(rng.randrange(directions))) for s in sorted(state.satellites))
+    state.on_board = {}
+    state.supports = {}
+    state.calibration_target = {}
+    for i in range(instruments):
+        instrument = 'instrument{}'.format(i)
+        state.on_board[instrument] = 'satellite{}'.format(i % satellites)
+        supported = {'mode{}'.format(i % modes)}
+        supported.update(rng.sample(sorted(state.modes), rng.randrange(modes)))
+        state.supports[instrument] = supported
+        state.calibration_target[instrument] = 'direction{}'.format(rng.randrange(directions))
+    state.power_on = dict((i, False) for i in state.instruments)
+    state.calibrated = dict((i, False) for i in state.instruments)
+    state.have_image = dict((d, '') for d in state.directions)
+    targets = rng.sample(range(directions), min(images, directions))
+    goals = [('have_image', 'direction{}'.format(d), 'mode{}'.format(rng.randrange(modes))) for d in targets]
+    return state, goals
+
+
+generators = {'logistics': logistics_problem, 'satellite': satellite_problem}
+
+
+def scaled_problem(domain, size, seed=0):
+    """
+    Return a problem of the given domain whose difficulty grows with size:
+    size packages over size // 4 + 1 cities for logistics, and size images
+    with size // 2 + 1 satellites for satellite.
+    """
+    if domain == 'logistics':
+        return logistics_problem(size, size // 4 + 1, planes=size // 8 + 1, seed=seed)
+    if domain == 'satellite':
+        return satellite_problem(size // 2 + 1, size + 2, 2 * size + 2, size, seed=seed)
+    raise ValueError('unknown domain {!r}'.format(domain))
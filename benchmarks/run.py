@@ -0,0 +1,88 @@
+"""
+Benchmark runner: solves generated problems of increasing size and writes
+one JSON object per run, with the wall time, peak memory, nodes expanded
+and plan length, so that results can be compared between planner changes.
+The domains iterate over sets, so fix PYTHONHASHSEED for comparable runs.
+
+    python -m benchmarks.run --domain logistics --sizes 5,10,20,40 --repeat 3
+"""
+
+from __future__ import print_function
+import argparse, json, os, platform, sys, time, tracemalloc
+import hgn_pyhop
+import logistics_domain, satellite_domain  # Declare the operators and methods
+from benchmarks.generators import scaled_problem
+
+
+def run_problem(state, goals, measure_memory=True, timeout=None, **options):
+    """
+    Solve one problem and return a dict of measurements. Wall time and
+    nodes come from a plain run; peak memory from a second run under
+    tracemalloc, which would distort the timing. Each run gets timeout
+    seconds of its own, and the second must return the same result.
+    """
+    stats = hgn_pyhop.SearchStats()
+    started = time.perf_counter()
+    plan = hgn_pyhop.pyhop(state, goals, stats=stats, deadline=_deadline(timeout), **options)
+    wall_time = time.perf_counter() - started
+    result = {'status': _status(plan), 'plan_length': len(plan) if plan else None,
+              'wall_time': round(wall_time, 6), 'nodes': stats.nodes, 'backtracks': stats.backtracks,
+              'max_depth': stats.max_depth}
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            again = hgn_pyhop.pyhop(state, goals, deadline=_deadline(timeout), **options)
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert _status(again) == result['status'] and (not plan or again == plan), \
+            'the run under tracemalloc returned {} instead of {}'.format(_status(again), result['status'])
+    return result
+
+
+def _deadline(timeout):
+    return None if timeout is None else time.time() + timeout
+
+
+def _status(plan):
+    if isinstance(plan, hgn_pyhop.BudgetExhausted):
+        return 'budget:' + plan.reason
+    return 'solved' if plan is not False else 'failed'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark HGNpyhop on generated problems.')
+    parser.add_argument('--domain', choices=['logistics', 'satellite'], action='append',
+                        help='domain to benchmark; may be repeated (default: both)')
+    parser.add_argument('--sizes', default='5,10,20,40', help='comma-separated problem sizes')
+    parser.add_argument('--repeat', type=int, default=1, help='problems (seeds) per size')
+    parser.add_argument('--engine', default='iterative', choices=['recursive', 'iterative'])
+    parser.add_argument('--compact', action='store_true', help='solve compiled CompactStates')
+    parser.add_argument('--max-nodes', type=int, default=100000, help='node budget per problem')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds per problem')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    parser.add_argument('--output', help='file to write JSON lines to (default: standard output)')
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for domain in args.domain or ['logistics', 'satellite']:
+            for size in [int(size) for size in args.sizes.split(',')]:
+                for seed in range(args.repeat):
+                    state, goals = scaled_problem(domain, size, seed)
+                    if args.compact:
+                        state = hgn_pyhop.compile_state(state)
+                    result = {'domain': domain, 'size': size, 'seed': seed, 'engine': args.engine,
+                              'compact': args.compact, 'python': platform.python_version(),
+                              'hash_seed': os.environ.get('PYTHONHASHSEED')}
+                    result.update(run_problem(state, goals, not args.no_memory, engine=args.engine,
+                                              max_nodes=args.max_nodes, timeout=args.timeout))
+                    print(json.dumps(result, sort_keys=True), file=output)
+                    output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
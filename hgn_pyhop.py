@@ -76,6 +76,31 @@ Pyhop provides the following classes and functions:
   To put variables and values into it, you should do assignments such as
   foo.var1 = val1
 
+- foo.copy() returns a copy-on-write copy of foo: variables are shared with
+  foo until one of the two states writes them, and only copied if they are
+  not bound to immutable values. Operators and methods the planner runs
+  read shared dicts and sets as they are; other code that reads a shared
+  mutable variable copies it first. The planner uses it in place of
+  copy.deepcopy when it applies operators.
+
+- hash(foo) and foo == bar compare states by their variable bindings. The
+  hash is updated as variables are written, so it costs one step per
+  variable whatever their size; equality checks it first.
+
+- UndoState(foo) is a copy of foo that is modified in place and records
+  each write, so that foo.rollback(foo.mark()) style backtracking replaces
+  copying; pyhop(...,undo=True) plans with one.
+
+- compile_state(foo) returns a CompactState with the same variables as
+  foo, stored as arrays of interned integers. Domain functions use it like
+  foo, and copies, equality and hashing are much cheaper for problems with
+  thousands of objects.
+
+- vector_select(foo, foo.trucks, conditions) returns the objects of a
+  CompactState that satisfy bindings such as ('in_city', ('at', 'x'), c),
+  evaluated for all of them at once with numpy; vector_view(foo, 'at') is
+  a numpy view of the integer-encoded variable. Both need numpy.
+
 - bar = Goal('bar') tells Pyhop to create an empty goal object named 'bar'.
   To put variables and values into it, you should do assignments such as
   bar.var1 = val1
@@ -96,10 +121,98 @@ Pyhop provides the following classes and functions:
 
 - print_methods() will print out a list of all declared methods.
 
+- op = operator_schema('op', ('x', 'y'), preconditions, effects, __name__)
+  compiles an operator from bindings over its parameters; the planner
+  checks its preconditions before copying the state, and op.reads and
+  op.writes list the state variables it uses.
+
+- @relevance(obj, value) declares on an operator or method which goals it
+  can be relevant to, e.g. @relevance('trucks', 'locations'). The planner
+  only tries the declarations whose guards accept the goal.
+
+- A method may return Alternatives([subgoals1, subgoals2, ...]) to offer
+  several decompositions of a goal, tried in order.
+
 - pyhop(state1,tasklist) tells Pyhop to find a plan for accomplishing tasklist
   (a list of tasks), starting from an initial state state1, using whatever
   methods and operators you declared previously.
 
+- pyhop(state1,tasklist,engine='iterative') runs the same search with an
+  explicit stack instead of recursion; use it for plans with thousands of
+  steps, which exceed Python's recursion limit.
+
+- pyhop(state1,tasklist,table=TranspositionTable()) remembers the
+  (state, remaining goals) subproblems that failed and prunes them when the
+  search reaches them again; the table counts its hits and misses.
+
+- pyhop_parallel(state1,tasklist,workers=4) searches the alternatives of
+  the first choice points on a pool of worker processes and returns the
+  first plan found, or the plan selected by its prefer argument.
+
+- plan_batch(problems,workers=4,timeout=1.0) solves a stream of
+  (state, tasklist) pairs on a pool of worker processes and yields
+  (index, plan) pairs as they complete. A PlanningPool keeps the workers,
+  with the domains imported, across batches.
+
+- validate_plan(state1,plan,tasklist) replays plan with the declared
+  operators and returns a ValidationResult, which is false and gives the
+  first failing step if the plan does not apply or leaves a goal
+  unachieved; validate_plans(triples,workers=4) checks a stream of
+  (state, plan, tasklist) triples on worker processes.
+
+- pyhop_decomposed(state1,tasklist) splits the goals into clusters that do
+  not interact, solves each cluster separately (on worker processes, with
+  workers=N) and concatenates the plans; partition_goals(state1,tasklist)
+  returns the clusters.
+
+- pyhop(state1,tasklist,cycles='prune') fails the nodes that seek the same
+  goal in the same state as a node above them, instead of looping;
+  cycles='detect' only counts them in the SearchStats.
+
+- pyhop(state1,tasklist,max_nodes=10000,max_depth=500,deadline=t) bounds
+  the search; when a budget runs out it returns a BudgetExhausted, which
+  is false like False but carries the reason and the search statistics.
+
+- pyhop(state1,tasklist,stats=SearchStats()) fills in the SearchStats with
+  the nodes expanded, backtracks, calls and time of each operator and
+  method, time spent copying states, etc.; print them with
+  stats.print_stats(). tracer=Tracer() subclasses receive the same events
+  as callbacks. Without stats or tracer none of this is collected.
+
+- pyhop(state1,tasklist,engine='best-first') runs a best-first (weighted
+  A*) search that ranks partial plans by their cost plus weight times a
+  heuristic estimate of the remaining goals; declare_heuristic(<variable>,
+  h) supplies a domain's estimate for the goals on a state variable.
+
+- pyhop_anytime(state1,tasklist,deadline=...) is a generator that yields
+  the first plan found and then each strictly cheaper plan until the search
+  ends or a budget runs out. pyhop(state1,tasklist,engine='anytime',
+  on_plan=f) runs the same search, calls f with each improved plan and
+  returns the best. Both prune cycles unless told otherwise, since branch
+  and bound alone never ends in domains whose methods loop.
+
+- pyhop(state1,tasklist,tree=True) returns the decomposition tree of the
+  plan: a list of PlanNodes recording, for each goal, the operator or
+  method used and the nodes of its subgoals; tree_plan(tree) is the plan.
+  replan(state2,tree,delta) repairs it after the world changed, searching
+  again only for the goals whose part of the plan no longer works.
+  dump_trees(trees,file) and load_trees(file) store and reload many trees,
+  as JSON lines or, with format='pickle', in a compact binary form.
+
+- pyhop(state1,tasklist,cache=SubplanCache(path='plans.db')) reuses the
+  plans found for goals in earlier calls, once they are checked to still
+  work; declare_projection(<variable>, f) tells it which part of the state
+  such plans depend on.
+
+- iter_plans(state1,tasklist) is a generator of all the plans, in the order
+  depth-first search finds them; each next plan resumes the search where
+  the previous one was found.
+
+- pyhop_steps(state1,tasklist,pause=100) runs the search a few nodes at a
+  time for callers that interleave it with other work; the hgn_pyhop_async
+  module builds asyncio coroutines (pyhop_async, pyhop_in_executor) and a
+  concurrency-limited AsyncPlanner on it.
+
 - In the above call to pyhop, you can add an optional 3rd argument called
   'verbose' that tells pyhop how much debugging printout it should provide:
 - if verbose = 0 (the default), pyhop returns the solution but prints nothing;
@@ -147,15 +260,465 @@ Pyhop provides the following classes and functions:
 
 
 from __future__ import print_function
-import copy, sys, pprint
+import copy, sys, json, time, heapq, pickle, pprint, sqlite3, hashlib, keyword, weakref, importlib, itertools, threading, multiprocessing
+from array import array
+from types import MappingProxyType
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+try:
+    import numpy
+except ImportError:  # Only vector_view and vector_select need it
+    numpy = None
 
 
 ############################################################
 # States and goals
-class State:
-    """A state is just a collection of variable bindings."""
+class State(object):
+    """
+    A state is just a collection of variable bindings.
+
+    Copies made with state.copy() are copy-on-write: parent and child share
+    every mutable variable until one of them writes it. While the planner
+    runs an operator, method or heuristic on a state, the dicts and sets the
+    state shares are handed to it as they are, and the first write to one
+    of them leaves a copy of the old value to the other states. Anywhere
+    else, reading a shared mutable variable first gives the state a copy
+    of its own, along with the mutable values stored in it, such as lists
+    in a dict. Variables bound to immutable values, such as numbers and
+    strings, are never copied.
+
+    States hash and compare by their variable bindings. Each (variable, key,
+    value) binding contributes a component to the hash, XORed in and out as
+    the variable is written, so hashing a state costs one step per variable
+    rather than per binding; equality checks the hashes before the bindings.
+    """
     def __init__(self, name):
         self.__name__ = name
+        self._shared = {}  # Variable name -> _Binding shared with other states, unless in __dict__
+
+    def __getattr__(self, name):
+        # Only reached for variables that are currently shared with another state
+        shared = self.__dict__.get('_shared')
+        if shared is None or name not in shared or name.startswith('__'):
+            raise AttributeError(name)
+        binding = shared[name]
+        value = binding.value
+        if type(value) in _immutable:  # Nothing to copy
+            self.__dict__[name] = value
+            return value
+        context = _context
+        if context.state is self and binding.thread is context.thread and type(value) in _copied_on_write and not value._nested:
+            return value
+        return self._own(name)
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if not name.startswith('_'):
+            self._shared.pop(name, None)
+
+    def __delattr__(self, name):
+        self._shared.pop(name, None)
+        self.__dict__.pop(name, None)
+
+    def __eq__(self, other):
+        if not isinstance(other, State):
+            return NotImplemented
+        return self is other or (hash(self) == hash(other) and self._variables() == other._variables())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        frozen = self.__dict__.get('_statics')
+        result = frozen[3] if frozen is not None else 0
+        owned = self.__dict__
+        for name, binding in self._shared.items():
+            if name in owned:
+                continue
+            value = binding.value
+            if isinstance(value, (_HashedDict, _HashedSet)):
+                if value._hash is None:
+                    value._hash = _variable_hash(name, value)
+                result ^= value._hash
+            else:  # Shared values that cannot keep their own hash are never written
+                if binding.hash is None:
+                    binding.hash = _variable_hash(name, value)
+                result ^= binding.hash
+        for name, value in owned.items():
+            if name.startswith('_') or (frozen is not None and name in frozen[1]):
+                continue
+            if isinstance(value, (_HashedDict, _HashedSet)):
+                if value._hash is None:
+                    value._hash = _variable_hash(name, value)
+                result ^= value._hash
+            else:
+                result ^= _variable_hash(name, value)
+        return result
+
+    def __getstate__(self):
+        state = {'__name__': self.__name__}
+        for name, value in self._variables().items():
+            state[name] = dict(value) if isinstance(value, MappingProxyType) else value  # Static variables
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__['_shared'] = {}
+        self.__dict__.update(state)
+
+    def _variables(self):
+        """Return an ordered dict of variable name -> value, shared or not."""
+        owned = self.__dict__
+        result = {}
+        for name, binding in self._shared.items():
+            result[name] = owned.get(name, binding.value)
+        for name, value in owned.items():
+            if not name.startswith('_') and name not in result:
+                result[name] = value
+        return result
+
+    def _own(self, name):
+        """Make shared variable name private to this state and return its value."""
+        binding = self._shared[name]
+        value = self.__dict__[name] = _hashed(name, binding.value, binding.hash)
+        return value
+
+    def copy(self):
+        """Return a copy-on-write copy of this state."""
+        shared = self._shared
+        owned = self.__dict__
+        frozen = owned.get('_statics')
+        for name in [name for name in owned if not name.startswith('_')]:
+            if frozen is not None and name in frozen[1]:  # Never written, so they need no sharing
+                continue
+            value = owned[name]
+            if type(value) not in _immutable:  # From now on the parent must copy before writing, too
+                shared[name] = _Binding(name, owned.pop(name))
+            elif name not in shared or shared[name].value is not value:
+                shared[name] = _Binding(name, value)
+        child = State.__new__(State)
+        child.__dict__.update(owned)  # Immutable values, frozen static variables and what the planner caches
+        child.__dict__['_shared'] = dict(shared)
+        return child
+
+
+class _Binding(object):
+    """
+    The value of a variable that copies of a state share. They all refer to
+    the same _Binding, so the first write to a shared dict or set leaves the
+    old value to all the others in one assignment (see _unshare). hash
+    caches the hash of a value that does not keep its own; thread is the
+    thread whose states share it, the only one that may read it unshared.
+    """
+    __slots__ = ('value', 'hash', 'thread')
+
+    def __init__(self, name, value):
+        if type(value) is dict and _immutable.issuperset(map(type, value.values())):
+            value = _HashedDict(value)
+            value._name = name
+            value._nested = False
+        elif type(value) is set:
+            value = _HashedSet(value)
+            value._name = name
+        if type(value) in _copied_on_write:
+            value._binding = self
+        self.value = value
+        self.hash = None
+        self.thread = _context.thread
+
+
+class _Context(threading.local):
+    def __init__(self):
+        self.state = None  # The state the planner is running domain code on
+        self.thread = object()  # Stands for this thread in the _Bindings it makes
+
+
+_context = _Context()
+
+
+def _on(state, function, args):
+    """
+    Call function(state, *args), an operator, method or heuristic working
+    on state: it reads the dicts and sets state shares without copying them.
+    """
+    context = _context
+    previous = context.state
+    context.state = state
+    try:
+        return function(state, *args)
+    finally:
+        context.state = previous
+
+
+def _peek(state, name):
+    """Return the value of variable name of state, for the planner to read but not write."""
+    if type(state) is State:
+        value = state.__dict__.get(name, _missing)
+        if value is _missing:
+            binding = state._shared.get(name)
+            if binding is None:
+                raise AttributeError(name)
+            return binding.value
+        return value
+    return getattr(state, name)
+
+
+def _unshare(value, old):
+    """
+    Before the first write to value, a dict or set that states share, hand
+    old, a copy of it, to all of them, except to the state the planner is
+    running domain code on, which keeps value if it is one of them.
+    """
+    binding = value._binding
+    value._binding = None
+    old._name = value._name
+    old._hash = value._hash
+    old._nested = value._nested
+    old._binding = binding
+    binding.value = old
+    state = _context.state
+    if isinstance(state, State):
+        if state.__dict__['_shared'].get(value._name) is binding and value._name not in state.__dict__:
+            state.__dict__[value._name] = value
+
+
+def _hashed(name, value, known=None):
+    """
+    Return a clone of a variable's value for a state to own. Dicts and sets
+    are copied into subclasses that keep their hash up to date once it is
+    known (known, or the one value carries) and that copies of the state
+    can share; anything else is cloned with _clone.
+    """
+    if known is None:
+        known = getattr(value, '_hash', None)
+    if isinstance(value, dict):
+        hashed = _HashedDict(value)
+        hashed._nested = value._nested if type(value) is _HashedDict else not _immutable.issuperset(map(type, value.values()))
+        if hashed._nested:
+            _detach(hashed)
+    elif isinstance(value, set):
+        hashed = _HashedSet(value)
+    else:
+        return _clone(value)
+    hashed._name = name
+    hashed._hash = known
+    return hashed
+
+
+# Values that states can share, since nobody modifies them (MappingProxyType: frozen static variables)
+_immutable = frozenset([str, int, float, complex, bool, bytes, tuple, frozenset, type(None), MappingProxyType])
+
+
+def _clone(value):
+    """
+    Return a copy of a variable's value that shares nothing mutable with it:
+    dicts are copied along with the mutable values stored in them, sets
+    (of hashable, hence usually immutable, items) shallowly, anything else
+    with copy.deepcopy.
+    """
+    if type(value) in _immutable:
+        return value
+    if isinstance(value, dict):
+        return _detach(copy.copy(value))
+    if isinstance(value, set):
+        return copy.copy(value)
+    return copy.deepcopy(value)
+
+
+def _detach(clone):
+    """Replace the mutable values stored in clone, a new copy of a dict, by deep copies."""
+    if not _immutable.issuperset(map(type, clone.values())):
+        for key, item in list(clone.items()):
+            if type(item) not in _immutable:
+                dict.__setitem__(clone, key, copy.deepcopy(item))
+    return clone
+
+
+def _variable_hash(name, value):
+    """Return the hash of a state variable: the XOR of the components of its bindings."""
+    if isinstance(value, (dict, MappingProxyType, _VectorView)):
+        result = hash(name)
+        for key, item in value.items():
+            result ^= _binding_hash(name, key, item)
+        return result
+    if isinstance(value, (set, frozenset)):
+        result = hash(name)
+        for item in value:
+            result ^= hash((name, item))
+        return result
+    return hash((name, _freeze(value)))
+
+
+def _binding_hash(name, key, value):
+    try:
+        return hash((name, key, value))
+    except TypeError:  # Unhashable values, such as the sets in state.supports
+        return hash((name, key, _freeze(value)))
+
+
+class _HashedDict(dict):
+    """
+    A dict variable owned by one state, or shared by copies of a state
+    through _binding until its first write. Every write XORs the components
+    of the old and new bindings out of and into _hash, which is None until
+    the state is first hashed. _nested tells if it may hold mutable values,
+    which writes to it would not cover.
+    """
+    __slots__ = ('_name', '_hash', '_binding', '_nested')
+
+    def __init__(self, items=()):
+        dict.__init__(self, items)
+        self._name = None
+        self._hash = None
+        self._binding = None
+        self._nested = True
+
+    def __setitem__(self, key, value):
+        if self._binding is not None:
+            _unshare(self, _HashedDict(self))
+        if self._hash is not None:
+            old = dict.get(self, key, _missing)
+            if old is not _missing:
+                self._hash ^= _binding_hash(self._name, key, old)
+            self._hash ^= _binding_hash(self._name, key, value)
+        if type(value) not in _immutable:
+            self._nested = True
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self._binding is not None:
+            _unshare(self, _HashedDict(self))
+        value = self[key]
+        dict.__delitem__(self, key)
+        if self._hash is not None:
+            self._hash ^= _binding_hash(self._name, key, value)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        if self._binding is not None:
+            _unshare(self, _HashedDict(self))
+        key, value = dict.popitem(self)
+        if self._hash is not None:
+            self._hash ^= _binding_hash(self._name, key, value)
+        return key, value
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+
+class _HashedSet(set):
+    """A set variable, owned or shared, which keeps _hash up to date like _HashedDict."""
+    __slots__ = ('_name', '_hash', '_binding', '_nested')
+
+    def __init__(self, items=()):
+        set.__init__(self, items)
+        self._name = None
+        self._hash = None
+        self._binding = None
+        self._nested = False  # Its items are hashable, so they are not written in place
+
+    def add(self, item):
+        if item not in self:
+            if self._binding is not None:
+                _unshare(self, _HashedSet(self))
+            if self._hash is not None:
+                self._hash ^= hash((self._name, item))
+            set.add(self, item)
+
+    def discard(self, item):
+        if item in self:
+            if self._binding is not None:
+                _unshare(self, _HashedSet(self))
+            if self._hash is not None:
+                self._hash ^= hash((self._name, item))
+            set.discard(self, item)
+
+    def remove(self, item):
+        if item not in self:
+            raise KeyError(item)
+        self.discard(item)
+
+    def pop(self):
+        for item in self:
+            self.discard(item)
+            return item
+        raise KeyError('pop from an empty set')
+
+    def clear(self):
+        for item in list(self):
+            self.discard(item)
+
+    def update(self, *others):
+        for other in others:
+            for item in other:
+                self.add(item)
+
+    def difference_update(self, *others):
+        for other in others:
+            for item in other:
+                self.discard(item)
+
+    def intersection_update(self, *others):
+        kept = set(self).intersection(*others)
+        for item in list(self):
+            if item not in kept:
+                self.discard(item)
+
+    def symmetric_difference_update(self, other):
+        for item in set(other):
+            if item in self:
+                self.discard(item)
+            else:
+                self.add(item)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+    def __repr__(self):
+        return repr(set(self))
+
+    def __reduce_ex__(self, protocol):
+        return set, (set(self),)
+
+
+_copied_on_write = (_HashedDict, _HashedSet)  # Exactly these types, not the UndoState ones
 
 
 class Goal:
@@ -168,11 +731,11 @@ class Goal:
 def print_state(state, indent=4):
     """Print each variable in state, indented by indent spaces."""
     if state != False:
-        for (name, val) in vars(state).items():
+        for (name, val) in state_variables(state).items():
             if name != '__name__':
                 for x in range(indent): sys.stdout.write(' ')
                 sys.stdout.write(state.__name__ + '.' + name)
-                print(' =', val)
+                print(' =', dict(val) if isinstance(val, MappingProxyType) else val)
     else:
         print('False')
 
@@ -189,6 +752,549 @@ def print_goal(goal, indent=4):
         print('False')
 
 
+def copy_state(state):
+    """
+    Return a copy of state that operators may modify. States are copied
+    on write; any other object falls back to copy.deepcopy.
+    """
+    if isinstance(state, (State, CompactState)):
+        return state.copy()
+    return copy.deepcopy(state)
+
+
+def state_variables(state):
+    """Return a dict of the variables of state (or of a goal), by name."""
+    if isinstance(state, (State, CompactState)):
+        return state._variables()
+    return vars(state)
+
+
+############################################################
+# Compact states
+def compile_state(state):
+    """
+    Return a CompactState with the same variables as state. Sets of objects,
+    such as state.trucks, are kept as frozensets; every dict variable
+    becomes a vector of small integers. The objects and values are interned
+    once here, and the copies of the compact state share the interning.
+    """
+    layout = _Layout()
+    compact = CompactState.__new__(CompactState)
+    compact.__name__ = state.__name__
+    compact._layout = layout
+    compact._constants = {}
+    compact._vectors = {}
+    compact._views = {}
+    compact._relevant = None
+    for (name, value) in state_variables(state).items():
+        if name != '__name__':
+            setattr(compact, name, value)
+    return compact
+
+
+class _Layout(object):
+    """The interning tables shared by a compact state and its copies."""
+    def __init__(self):
+        self.positions = {}     # Variable name -> {object: index in its vector}
+        self.objects = {}       # Variable name -> [object at each index]
+        self.values = []        # Value id -> value
+        self.value_ids = {}     # (type, value) -> value id
+        self.indexes = {}       # Variable name -> (its vector's bytes or its value, static_index of it)
+
+    def intern(self, value):
+        """Return the id of value, interning it if it is new."""
+        if isinstance(value, (set, list, dict)):
+            value = _freeze(value)
+        key = (value.__class__, value)
+        value_id = self.value_ids.get(key)
+        if value_id is None:
+            value_id = self.value_ids[key] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def position(self, name, obj):
+        """Return the index of obj in the vectors of variable name, adding it if it is new."""
+        positions = self.positions.setdefault(name, {})
+        index = positions.get(obj)
+        if index is None:
+            index = positions[obj] = len(positions)
+            self.objects.setdefault(name, []).append(obj)
+        return index
+
+
+class CompactState(object):
+    """
+    A state whose dict variables are stored as arrays of interned value ids,
+    created with compile_state(). Domain functions see the same interface as
+    a State: state.at[o] reads and state.at[o] = l writes through a
+    dict-like view, and type sets such as state.trucks are frozensets.
+    Copies only copy the arrays, and equality and hashing compare them, so
+    compact states are only equal if they share the interning, i.e. come
+    from the same compile_state call; compare their to_state() otherwise.
+    """
+    __slots__ = ('__name__', '_layout', '_constants', '_vectors', '_views', '_relevant')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        view = self._views.get(name)
+        if view is not None:
+            return view
+        if name in self._vectors:
+            view = self._views[name] = _VectorView(self, name)
+            return view
+        if name in self._constants:
+            return self._constants[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        self._views.pop(name, None)
+        if isinstance(value, dict):
+            layout = self._layout
+            vector = array('i')
+            for (obj, val) in value.items():
+                index = layout.position(name, obj)
+                if index >= len(vector):
+                    vector.extend([-1] * (index + 1 - len(vector)))
+                vector[index] = layout.intern(val)
+            self._vectors[name] = vector
+            self._constants.pop(name, None)
+        else:
+            if isinstance(value, (set, list)):
+                value = _freeze(value)
+            self._constants = dict(self._constants)  # Shared with the copies of this state
+            self._constants[name] = value
+            self._vectors.pop(name, None)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactState):
+            return NotImplemented
+        # Value ids mean nothing across layouts, and __hash__ could not agree with decoded comparisons
+        return (self._layout is other._layout and self._vectors == other._vectors
+                and self._constants == other._constants)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(tuple(sorted((name, vector.tobytes()) for (name, vector) in self._vectors.items())))
+
+    def __getstate__(self):
+        return (self.__name__, self._layout, self._constants, self._vectors)
+
+    def __setstate__(self, state):
+        self.__name__, self._layout, self._constants, self._vectors = state
+        self._views = {}
+        self._relevant = None
+
+    def _variables(self):
+        """Return a dict of variable name -> value, with the vectors decoded into dicts."""
+        variables = dict(self._constants)
+        for name in self._vectors:
+            variables[name] = dict(_VectorView(self, name).items())
+        return variables
+
+    def copy(self):
+        """Return a copy of this state; only the vectors are copied."""
+        child = CompactState.__new__(CompactState)
+        child.__name__ = self.__name__
+        child._layout = self._layout
+        child._constants = self._constants
+        child._vectors = dict((name, vector[:]) for (name, vector) in self._vectors.items())
+        child._views = {}
+        child._relevant = self._relevant
+        return child
+
+    def to_state(self):
+        """Return an ordinary State with the same variables."""
+        state = State(self.__name__)
+        for (name, value) in self._variables().items():
+            setattr(state, name, value)
+        return state
+
+
+class _VectorView(object):
+    """Dict-like view of a variable of a CompactState."""
+    __slots__ = ('_state', '_name', '_positions', '_values')
+
+    def __init__(self, state, name):
+        self._state = state
+        self._name = name
+        self._positions = state._layout.positions.setdefault(name, {})
+        self._values = state._layout.values
+
+    def _vector(self):
+        return self._state._vectors[self._name]
+
+    def __getitem__(self, key):
+        index = self._positions.get(key)
+        vector = self._vector()
+        if index is None or index >= len(vector) or vector[index] < 0:
+            raise KeyError(key)
+        return self._values[vector[index]]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        layout = self._state._layout
+        index = layout.position(self._name, key)
+        vector = self._vector()
+        if index >= len(vector):
+            vector.extend([-1] * (index + 1 - len(vector)))
+        vector[index] = layout.intern(value)
+
+    def __delitem__(self, key):
+        self[key]  # KeyError if absent
+        self._vector()[self._positions[key]] = -1
+
+    def __contains__(self, key):
+        index = self._positions.get(key)
+        vector = self._vector()
+        return index is not None and index < len(vector) and vector[index] >= 0
+
+    def keys(self):
+        vector = self._vector()
+        objects = self._state._layout.objects.get(self._name, [])
+        return [objects[i] for i in range(len(vector)) if vector[i] >= 0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(1 for value_id in self._vector() if value_id >= 0)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def __eq__(self, other):
+        return dict(self.items()) == (dict(other.items()) if isinstance(other, _VectorView) else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+############################################################
+# Vectorized conditions over compact states (needs numpy)
+_vector_caches = weakref.WeakKeyDictionary()  # _Layout -> arrays derived from its interning tables
+
+
+def vector_view(state, state_variable):
+    """
+    Return a read-only numpy array over the vector of a dict variable of
+    the CompactState state, without copying it: element i is the value id
+    of the i-th object of the variable, or -1 if it has no value. The
+    array is only valid until the variable is next written, and the state
+    cannot add objects to the variable while the array exists.
+    """
+    _require_numpy()
+    if not isinstance(state, CompactState):
+        raise TypeError('vector views need a CompactState (see compile_state), not {}'.format(type(state).__name__))
+    vector = state._vectors[state_variable]
+    if not vector:
+        return numpy.empty(0, dtype=vector.typecode)
+    view = numpy.frombuffer(vector, dtype=vector.typecode)
+    view.flags.writeable = False
+    return view
+
+
+def vector_select(state, candidates, conditions, parameter='x'):
+    """
+    Return the candidates, in the order they are iterated, for which all
+    conditions hold in the CompactState state. Each condition is a binding
+    (<variable>, key, value) or (<set variable>, term), with terms as in
+    operator_schema; parameter stands for the candidate. The conditions are
+    evaluated on the value ids of all the candidates at once with numpy, so
+    a domain can pick a grounding without a Python loop over objects, e.g.
+    the trucks in the city of package o:
+        vector_select(state, state.trucks, [('in_city', ('at', 'x'), ('in_city', ('at', o)))])
+    An object or value without a binding fails the condition. The arrays
+    derived from candidates and sets are cached, so pass the same
+    collection, such as state.trucks, from call to call.
+    """
+    _require_numpy()
+    if not isinstance(state, CompactState):
+        raise TypeError('vector_select needs a CompactState (see compile_state), not {}'.format(type(state).__name__))
+    cache = _vector_caches.setdefault(state._layout, {})
+    objects, ids = _vector_ids(state, cache, candidates)
+    selected = numpy.ones(len(objects), dtype=bool)
+    for condition in conditions:
+        if len(condition) == 2:
+            members = _vector_ids(state, cache, getattr(state, condition[0]))[1]
+            value = _vector_term(state, cache, condition[1], parameter, ids)
+            holds = numpy.isin(value, members) & (value >= 0)
+        elif len(condition) == 3:
+            key = (condition[0], condition[1])
+            value = _vector_term(state, cache, key, parameter, ids)
+            expected = _vector_term(state, cache, condition[2], parameter, ids)
+            holds = (value == expected) & (value >= 0)
+        else:
+            raise ValueError('condition {!r} is not a (<variable>, key, value) or (<set variable>, term) tuple'
+                             .format(condition))
+        selected &= holds
+    return [objects[i] for i in numpy.flatnonzero(selected)]
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('vector_view and vector_select need numpy')
+
+
+def _vector_term(state, cache, term, parameter, ids):
+    """
+    Return the value ids of term for each candidate as an array or, for a
+    term that does not mention parameter, its single value id.
+    """
+    if not _mentions(term, parameter):
+        value = _vector_value(state, term)
+        return -1 if value is _missing else _vector_value_id(state, value)
+    if not _is_lookup(term):  # The parameter itself
+        return ids
+    keys = _vector_term(state, cache, term[1], parameter, ids)
+    vector = vector_view(state, term[0])
+    if not len(vector):
+        return numpy.full(len(keys), -1, dtype=numpy.int64)
+    positions = _vector_positions(state, cache, term[0])[numpy.maximum(keys, 0)]
+    present = (keys >= 0) & (positions >= 0) & (positions < len(vector))
+    return numpy.where(present, vector[numpy.clip(positions, 0, len(vector) - 1)], -1)
+
+
+def _vector_value(state, term):
+    """Return the value of a term that does not mention the parameter, or _missing."""
+    if not _is_lookup(term):
+        return term
+    key = _vector_value(state, term[1])
+    variable = getattr(state, term[0])
+    return variable[key] if key is not _missing and key in variable else _missing
+
+
+def _mentions(term, parameter):
+    if _is_lookup(term):
+        return _mentions(term[1], parameter)
+    return isinstance(term, str) and term == parameter
+
+
+def _is_lookup(term):
+    return isinstance(term, tuple) and len(term) == 2 and _schema_variable(term[0])
+
+
+def _vector_value_id(state, value):
+    """Return the value id of value, or -2 if no variable holds it (so that it equals no value id)."""
+    if isinstance(value, (set, list, dict)):
+        value = _freeze(value)
+    return state._layout.value_ids.get((value.__class__, value), -2)
+
+
+def _vector_positions(state, cache, state_variable):
+    """Return an array mapping each value id to the position of that value in the vectors of state_variable, or -1."""
+    layout = state._layout
+    positions = layout.positions.get(state_variable, {})
+    cached = cache.get(('positions', state_variable))
+    if cached is not None and cached[0] == (len(layout.values), len(positions)):
+        return cached[1]
+    table = numpy.full(len(layout.values), -1, dtype=numpy.int64)
+    for obj, index in positions.items():
+        value_id = layout.value_ids.get((obj.__class__, obj))
+        if value_id is not None:
+            table[value_id] = index
+    cache[('positions', state_variable)] = ((len(layout.values), len(positions)), table)
+    return table
+
+
+def _vector_ids(state, cache, collection):
+    """Return the objects of collection as a list and their value ids as an array, interning them if needed."""
+    cached = cache.get(('ids', id(collection)))
+    if cached is not None and cached[0] is collection:
+        return cached[1], cached[2]
+    objects = list(collection)
+    ids = numpy.array([state._layout.intern(obj) for obj in objects], dtype=numpy.int64)
+    if isinstance(collection, (frozenset, tuple)):  # Immutable, so the result stays valid
+        cache[('ids', id(collection))] = (collection, objects, ids)
+    return objects, ids
+
+
+############################################################
+# Undo states
+_missing = object()
+
+
+class UndoState(State):
+    """
+    A state that operators modify in place while it records each write in
+    an undo log: mark() returns the current position in the log and
+    rollback(mark) undoes every write made since. The planner uses one when
+    pyhop is called with undo=True, instead of copying the state at every
+    operator application.
+    Dict and set variables are replaced by subclasses that log their
+    changes, and assignments to variables are logged too. Values stored
+    inside variables, such as lists in a dict, are not logged, so they must
+    be replaced rather than mutated in place.
+    """
+    def __init__(self, state):
+        self.__dict__['__name__'] = state.__name__
+        self.__dict__['_shared'] = {}
+        self.__dict__['_log'] = []
+        for name, value in state_variables(state).items():
+            if not name.startswith('_'):  # Cloned, so that nothing is shared with state
+                self.__dict__[name] = _logged(name, value if isinstance(value, (dict, set, _VectorView)) else _clone(value), self._log)
+        if isinstance(state, State) and '_statics' in state.__dict__:
+            self.__dict__['_statics'] = state.__dict__['_statics']
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_'):
+            self._log.append((self, name, self.__dict__.get(name, _missing)))
+            value = _logged(name, value, self._log)
+        self.__dict__[name] = value
+
+    def __delattr__(self, name):
+        self._log.append((self, name, self.__dict__[name]))
+        del self.__dict__[name]
+
+    def __getstate__(self):
+        state = {'__name__': self.__name__}
+        state.update((name, _unlogged(value)) for name, value in self._variables().items())
+        return state
+
+    def __reduce_ex__(self, protocol):
+        return _unpickle_state, (self.__getstate__(),)
+
+    def _variables(self):
+        return dict((name, value) for name, value in self.__dict__.items() if not name.startswith('_'))
+
+    def _restore(self, name, old):
+        if old is _missing:
+            self.__dict__.pop(name, None)
+        else:
+            self.__dict__[name] = old
+
+    def mark(self):
+        """Return the current position in the undo log."""
+        return len(self._log)
+
+    def rollback(self, mark):
+        """Undo the writes made since mark."""
+        log = self._log
+        while len(log) > mark:
+            container, key, old = log.pop()
+            container._restore(key, old)
+
+    def changed_since(self, mark):
+        """
+        False if the writes made since mark have left every value as it was
+        at mark. Variables replaced by mutable values count as changed.
+        """
+        before = {}
+        for container, key, old in self._log[mark:]:
+            before.setdefault((id(container), key), (container, key, old))
+        for container, key, old in before.values():
+            if container is self:
+                if type(old) not in _immutable or old != self.__dict__.get(key, _missing):
+                    return True
+            elif isinstance(container, _LoggedSet):
+                if old != (key in container):
+                    return True
+            elif old != dict.get(container, key, _missing):
+                return True
+        return False
+
+    def copy(self):
+        """Return an ordinary State with the current values of the variables."""
+        state = State(self.__name__)
+        for name, value in self._variables().items():
+            setattr(state, name, _clone(value))
+        if '_statics' in self.__dict__:
+            state.__dict__['_statics'] = self._statics
+        return state
+
+
+def _unpickle_state(variables):
+    state = State.__new__(State)
+    state.__setstate__(variables)
+    return state
+
+
+def _logged(name, value, log):
+    """Return a copy of a variable's value that records its changes in log, if it is a dict or set."""
+    if isinstance(value, (dict, _VectorView)):
+        logged = _detach(_LoggedDict(value.items()))
+    elif isinstance(value, set):
+        logged = _LoggedSet(value)
+    else:
+        return value
+    logged._name = name
+    logged._hash = getattr(value, '_hash', None)
+    logged._log = log
+    return logged
+
+
+def _unlogged(value):
+    if isinstance(value, _LoggedDict):
+        return dict(value)
+    if isinstance(value, _LoggedSet):
+        return set(value)
+    return value
+
+
+class _LoggedDict(_HashedDict):
+    """A dict variable of an UndoState."""
+    __slots__ = ('_log',)
+
+    def __setitem__(self, key, value):
+        self._log.append((self, key, dict.get(self, key, _missing)))
+        _HashedDict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._log.append((self, key, self[key]))
+        _HashedDict.__delitem__(self, key)
+
+    def popitem(self):
+        key, value = _HashedDict.popitem(self)
+        self._log.append((self, key, value))
+        return key, value
+
+    def _restore(self, key, old):
+        if old is not _missing:
+            _HashedDict.__setitem__(self, key, old)
+        elif key in self:
+            _HashedDict.__delitem__(self, key)
+
+
+class _LoggedSet(_HashedSet):
+    """A set variable of an UndoState."""
+    __slots__ = ('_log',)
+
+    def add(self, item):
+        if item not in self:
+            self._log.append((self, item, False))
+            _HashedSet.add(self, item)
+
+    def discard(self, item):
+        if item in self:
+            self._log.append((self, item, True))
+            _HashedSet.discard(self, item)
+
+    def _restore(self, item, present):
+        if present:
+            _HashedSet.add(self, item)
+        else:
+            _HashedSet.discard(self, item)
+
+
 ############################################################
 # Helper functions that may be useful in domain models
 def forall(seq, cond):
@@ -212,6 +1318,11 @@ def find_if(cond, seq):
 # Commands to tell Pyhop what the operators and methods are
 operators = {}
 methods = {}
+heuristics = {}
+projections = {}
+statics = set()
+_guards = {}
+_generation = 0
 
 
 def declare_operators(state_variable, *op_list):
@@ -219,7 +1330,12 @@ def declare_operators(state_variable, *op_list):
     Call this after defining the operators, to tell Pyhop what they are.
     op_list must be a list of functions, not strings.
     """
+    for operator in op_list:  # Operators compiled by operator_schema know what they write
+        if state_variable not in getattr(operator, 'writes', (state_variable,)):
+            raise ValueError('operator {} never writes {}, so it cannot achieve goals on it'.format(
+                operator.__name__, state_variable))
     operators.update({state_variable: list(op_list)})
+    _compile_guards(op_list)
     return operators[state_variable]
 
 
@@ -230,85 +1346,2377 @@ def declare_methods(state_variable, *method_list):
     method_list must be a list of functions, not strings.
     """
     methods.update({state_variable: list(method_list)})
+    _compile_guards(method_list)
     return methods[state_variable]
 
 
-############################################################
-# Commands to find out what the operators and methods are
-def print_operators():
-    """Print out the names of the operators"""
-    print('{:<20}{}'.format('STATE VARIABLE:', 'RELEVANT OPERATORS:'))
-    for state_variable in operators:
-        print('{:<20}'.format(state_variable) + ', '.join([f.__name__ for f in operators[state_variable]]))
+def declare_heuristic(state_variable, heuristic):
+    """
+    Tell Pyhop how to estimate the cost of achieving goals on state_variable
+    for best-first search: heuristic(state, obj, value) returns an estimate
+    of the cost of the actions needed to achieve (state_variable, obj, value).
+    Without one, a goal is estimated as 0 if it holds and 1 otherwise.
+    """
+    heuristics[state_variable] = heuristic
+    return heuristic
 
 
-def print_methods():
-    """Print out a table of what the methods are for each task"""
-    print('{:<20}{}'.format('STATE VARIABLE:', 'RELEVANT METHODS:'))
-    for state_variable in methods:
-        print('{:<20}'.format(state_variable) + ', '.join([f.__name__ for f in methods[state_variable]]))
+def declare_projection(state_variable, projection):
+    """
+    Tell Pyhop what a plan for goals on state_variable depends on, for the
+    SubplanCache: projection(state, obj, value) returns a hashable summary
+    of the parts of state that a plan for (state_variable, obj, value)
+    depends on, or None if such goals are not worth caching. Without one,
+    the whole state is used.
+    """
+    projections[state_variable] = projection
+    return projection
 
 
-############################################################
-# The actual planner
-def pyhop(state, goals, verbose=0):
+def declare_static(*state_variables):
     """
-    Try to find a plan that accomplishes tasks in state.
-    If successful, return the plan. Otherwise return False.
+    Tell Pyhop that no operator ever changes the given state variables,
+    such as the type sets and a map of which city each location is in.
+    The planner freezes them once per problem (see freeze_static); copies
+    of the state then share them, state_key leaves them out, and
+    static_index can build inverse indexes over them.
     """
-    if verbose > 0:
-        print('** hgn_pyhop, verbose={} **\n   state = {}\n   goals = {}'.format(verbose, state.__name__, goals))
-    result = seek_plan(state, goals, [], 0, verbose)
-    if verbose > 0:
-        print('** result =', result, '\n')
-    return result
+    for declared in operators.values():
+        for operator in declared:
+            written = set(state_variables) & getattr(operator, 'writes', frozenset())
+            if written:
+                raise ValueError('operator {} writes {}, which cannot be static'.format(
+                    operator.__name__, ', '.join(sorted(written))))
+    statics.update(state_variables)
+    return sorted(statics)
 
 
-def seek_plan(state, goals, plan, depth, verbose=0):
+def freeze_static(state):
     """
-    Workhorse for pyhop. state and tasks are as in pyhop.
-    - plan is the current partial plan.
-    - depth is the recursion depth, for use in debugging
-    - verbose is whether to print debugging messages
+    Return a copy of state whose static variables are frozen: dicts become
+    read-only mappings and sets become frozensets, so that every copy of
+    the state can share them. pyhop does this itself. States with no
+    static variables, and states that are not State objects, are returned
+    unchanged.
     """
-    if verbose > 1:
-        print('depth {} goals {}'.format(depth, goals))
-    if goals == []:
-        if verbose > 2:
-            print('depth {} returns plan {}'.format(depth, plan))
-        return plan
-    goal1 = goals[0]
-    if getattr(state, goal1[0])[goal1[1]] == goal1[2]:  # Check whether goal1 is already satisfied
-        if verbose > 2:
+    if not isinstance(state, State) or '_statics' in state.__dict__:
+        return state
+    names = [name for name in state._variables() if name in statics]
+    if not names:
+        return state
+    state = state.copy()
+    for name in names:
+        value = state._variables()[name]
+        if isinstance(value, dict):
+            value = MappingProxyType(dict(value))
+        elif isinstance(value, set):
+            value = frozenset(value)
+        setattr(state, name, value)
+    # Equal static variables give equal tokens, in every process, so state_key can stand for them by their token
+    values = sorted((name, state.__dict__[name]) for name in names)
+    token = _digest([(name, dict(value) if isinstance(value, MappingProxyType) else value) for name, value in values])
+    hashed = 0  # What they contribute to hash(state), which must not depend on whether they are frozen
+    for name, value in values:
+        hashed ^= _variable_hash(name, value)
+    state.__dict__['_statics'] = (token, frozenset(names), {}, hashed)
+    return state
+
+
+def _search_state(state):
+    """
+    Return the state a search starts from: a copy of state, with its static
+    variables frozen. What the search caches on its states, such as the
+    relevant declarations, then lasts for this search only and never stays
+    on the caller's state.
+    """
+    frozen = freeze_static(state)
+    if frozen is state and isinstance(state, (State, CompactState)):
+        frozen = state.copy()
+    if isinstance(frozen, State):
+        frozen.__dict__.pop('_relevant', None)
+    elif isinstance(frozen, CompactState):
+        frozen._relevant = None
+    return frozen
+
+
+def static_index(state, state_variable):
+    """
+    Return the inverse of a static dict variable: a dict from each value to
+    the tuple of keys bound to it, in the order of the variable. Keys bound
+    to a set are listed under each of its members. For example
+    static_index(state, 'in_city')[city] lists the locations in city.
+    The index is built once per problem and shared by the copies of a
+    frozen state, or of a compact state for as long as the variable does
+    not change.
+    """
+    frozen = state.__dict__.get('_statics') if isinstance(state, State) else None
+    if frozen is not None and state_variable in frozen[2]:
+        return frozen[2][state_variable]
+    if isinstance(state, CompactState):  # Copies share the layout, and the vector tells if the variable changed
+        vector = state._vectors.get(state_variable)
+        source = vector.tobytes() if vector is not None else state._constants.get(state_variable)
+        cached = state._layout.indexes.get(state_variable)
+        if cached is not None and (cached[0] is source or cached[0] == source):
+            return cached[1]
+    index = OrderedDict()
+    for key, value in _peek(state, state_variable).items():
+        for member in (value if isinstance(value, (set, frozenset)) else (value,)):
+            index.setdefault(member, []).append(key)
+    index = dict((value, tuple(keys)) for value, keys in index.items())
+    if frozen is not None and state_variable in frozen[1]:
+        frozen[2][state_variable] = index
+    elif isinstance(state, CompactState):
+        state._layout.indexes[state_variable] = (source, index)
+    return index
+
+
+class Alternatives(list):
+    """
+    A method may return Alternatives([subgoals1, subgoals2, ...]) instead of
+    a single list of subgoals to offer several decompositions of a goal.
+    They are tried in order, as if each came from a method of its own.
+    """
+
+
+def goals_estimate(state, goals):
+    """
+    The default heuristic of best-first search: the sum of the estimates of
+    goals, an iterable of goals, in state.
+    """
+    total = 0
+    for goal in goals:
+        heuristic = heuristics.get(goal[0])
+        if heuristic is not None:
+            total += heuristic(state, *goal[1:])
+        elif _peek(state, goal[0])[goal[1]] != goal[2]:
+            total += 1
+    return total
+
+
+def relevance(obj=None, value=None):
+    """
+    Decorator that declares when an operator or method can be relevant to a
+    goal (<variable>, obj, value). Each guard may be None (anything), the
+    name of a type declared in the state, e.g. 'trucks' for obj in
+    state.trucks, a function f(state, x) returning True or False, or a
+    collection of the allowed values. Guards must only depend on facts that
+    never change during planning, such as the types of objects, because the
+    planner caches their results for each problem.
+    """
+    def decorate(function):
+        function.relevance = (obj, value)
+        return function
+    return decorate
+
+
+def _compile_guards(functions):
+    """Precompile the relevance guards of functions into predicates."""
+    global _generation
+    _generation += 1
+    for function in functions:
+        obj, value = getattr(function, 'relevance', (None, None))
+        _guards[function] = (_compile_guard(obj), _compile_guard(value))
+
+
+def _compile_guard(guard):
+    if guard is None or callable(guard):
+        return guard
+    if isinstance(guard, str):
+        return lambda state, x: x in _peek(state, guard)
+    allowed = frozenset(guard)
+    return lambda state, x: x in allowed
+
+
+def relevant_declarations(state, goal):
+    """
+    Return the operators and the methods declared for the state variable
+    of goal whose relevance guards accept goal, as a pair of tuples.
+    The result is cached per search: the states copied from the one it
+    starts from (see _search_state) share the cache.
+    """
+    if isinstance(state, State):
+        cache = state.__dict__.get('_relevant')
+    else:
+        cache = getattr(state, '_relevant', None)
+    if cache is None or cache[0] != _generation:
+        cache = (_generation, {})
+        if isinstance(state, State):
+            state.__dict__['_relevant'] = cache
+        elif isinstance(state, CompactState):
+            state._relevant = cache
+    try:
+        return cache[1][goal]
+    except KeyError:
+        pass
+    except TypeError:  # Unhashable goal, cannot be cached
+        return _relevant(state, goal, operators), _relevant(state, goal, methods)
+    result = cache[1][goal] = (_relevant(state, goal, operators), _relevant(state, goal, methods))
+    return result
+
+
+def _relevant(state, goal, declarations):
+    relevant = []
+    for function in declarations.get(goal[0], ()):
+        obj_guard, value_guard = _guards.get(function, (None, None))
+        if obj_guard is not None and not obj_guard(state, goal[1]):
+            continue
+        if value_guard is not None and len(goal) > 2 and not value_guard(state, goal[2]):
+            continue
+        relevant.append(function)
+    return tuple(relevant)
+
+
+############################################################
+# Operator schemas: operators declared as preconditions and effects
+def operator_schema(name, parameters, preconditions, effects, module=None):
+    """
+    Return an operator compiled from a declarative schema, for use with
+    declare_operators like any other operator. parameters names the
+    arguments after the state, e.g. ('o', 't'). A term is the name of a
+    parameter, a lookup (<variable>, term) standing for
+    state.<variable>[term], or any other value, which stands for itself.
+    Each precondition is a binding (<variable>, key, value), which holds if
+    state.<variable>[key] == value, (<variable>, key, bool), which holds if
+    state.<variable>[key] is true, or (<set variable>, term), which holds
+    if term is in the set; they are checked in order. Each effect is a
+    binding (<variable>, key, value) to assign; all the keys and values are
+    evaluated before the first assignment. module is the name of the module
+    that declares the operator, usually __name__; PlanningPool imports it
+    in its workers.
+    For example, load_truck is
+        operator_schema('load_truck', ('o', 't'),
+                        [('packages', 'o'), ('trucks', 't'), ('at', 'o', ('at', 't'))],
+                        [('at', 'o', 't')])
+    The operator has the usual signature and, in addition:
+    - applicable(state, *args), which checks the preconditions only, so
+      that the planner does not copy the state for operators that do not
+      apply;
+    - effects(state, *args), which applies the effects without checking;
+    - reads and writes, the sets of state variables it reads and writes;
+    - relevance, taken from the preconditions that put its first two
+      parameters in a set, unless a guard is given with @relevance.
+    A malformed schema raises ValueError here rather than during search.
+    """
+    parameters = tuple(parameters)
+    _check_schema(name, parameters, preconditions, effects)
+    constants = {}
+    reads = set()
+
+    def term(t):
+        if isinstance(t, str) and t in parameters:
+            return t
+        if _is_lookup(t):
+            reads.add(t[0])
+            return 'state.{}[{}]'.format(t[0], term(t[1]))
+        constant = '_c{}'.format(len(constants))
+        constants[constant] = t
+        return constant
+
+    tests = []
+    for precondition in preconditions:
+        reads.add(precondition[0])
+        if len(precondition) == 2:
+            tests.append('{} in state.{}'.format(term(precondition[1]), precondition[0]))
+        elif precondition[2] is bool:
+            tests.append('state.{}[{}]'.format(precondition[0], term(precondition[1])))
+        else:
+            tests.append('state.{}[{}] == {}'.format(precondition[0], term(precondition[1]), term(precondition[2])))
+    condition = ' and '.join(tests) or 'True'
+    evaluate = ['    _k{0}, _v{0} = {1}, {2}'.format(i, term(key), term(value)) for i, (_, key, value) in enumerate(effects)]
+    assign = ['    state.{}[_k{}] = _v{}'.format(variable, i, i) for i, (variable, _, _) in enumerate(effects)]
+    arguments = ', '.join(('state',) + parameters)
+    source = '\n'.join(['def _applicable({}):'.format(arguments),
+                        '    return {}'.format(condition),
+                        'def _effects({}):'.format(arguments)] + evaluate + assign + [
+                        '    return state',
+                        'def {}({}):'.format(name, arguments),
+                        '    if not ({}):'.format(condition),
+                        '        return False'] + evaluate + assign + [
+                        '    return state'])
+    namespace = dict(constants)
+    exec(compile(source, '<operator_schema {}>'.format(name), 'exec'), namespace)
+    operator = namespace[name]
+    operator.applicable = namespace['_applicable']
+    operator.effects = namespace['_effects']
+    operator.reads = frozenset(reads)
+    operator.writes = frozenset(effect[0] for effect in effects)
+    operator.schema = (parameters, tuple(preconditions), tuple(effects))
+    operator.relevance = tuple(_parameter_type(preconditions, p) for p in (parameters + (None, None))[:2])
+    operator.__module__ = module
+    return operator
+
+
+def _check_schema(name, parameters, preconditions, effects):
+    if not _schema_variable(name):
+        raise ValueError('operator name {!r} is not a valid identifier'.format(name))
+    for p in parameters:
+        if not _schema_variable(p) or p == 'state':
+            raise ValueError('{}: parameter name {!r} is not allowed'.format(name, p))
+    if len(set(parameters)) != len(parameters):
+        raise ValueError('{}: repeated parameter in {}'.format(name, parameters))
+    for precondition in preconditions:
+        if not (isinstance(precondition, tuple) and len(precondition) in (2, 3) and _schema_variable(precondition[0])):
+            raise ValueError('{}: precondition {!r} is not a (<variable>, key, value) or (<set variable>, term) tuple'
+                             .format(name, precondition))
+    if not effects:
+        raise ValueError('{}: an operator needs at least one effect'.format(name))
+    assigned = set()
+    for effect in effects:
+        if not (isinstance(effect, tuple) and len(effect) == 3 and _schema_variable(effect[0])):
+            raise ValueError('{}: effect {!r} is not a (<variable>, key, value) tuple'.format(name, effect))
+        if effect[0] in statics:
+            raise ValueError('{}: effect {!r} writes the static variable {}'.format(name, effect, effect[0]))
+        if effect[:2] in assigned:
+            raise ValueError('{}: {}[{!r}] is assigned twice'.format(name, effect[0], effect[1]))
+        assigned.add(effect[:2])
+
+
+def _schema_variable(name):
+    return (isinstance(name, str) and name.isidentifier() and not keyword.iskeyword(name)
+            and not name.startswith('_'))
+
+
+def _parameter_type(preconditions, parameter):
+    """Return the set variable that a precondition requires parameter to be in, if any."""
+    for precondition in preconditions:
+        if len(precondition) == 2 and precondition[1] == parameter:
+            return precondition[0]
+    return None
+
+
+############################################################
+# Commands to find out what the operators and methods are
+def print_operators():
+    """Print out the names of the operators"""
+    print('{:<20}{}'.format('STATE VARIABLE:', 'RELEVANT OPERATORS:'))
+    for state_variable in operators:
+        print('{:<20}'.format(state_variable) + ', '.join([f.__name__ for f in operators[state_variable]]))
+
+
+def print_methods():
+    """Print out a table of what the methods are for each task"""
+    print('{:<20}{}'.format('STATE VARIABLE:', 'RELEVANT METHODS:'))
+    for state_variable in methods:
+        print('{:<20}'.format(state_variable) + ', '.join([f.__name__ for f in methods[state_variable]]))
+
+
+############################################################
+# Memoization of failed subproblems
+def state_key(state):
+    """
+    Return a hashable, canonical snapshot of the variables of state:
+    two states with equal variable bindings have equal keys.
+    """
+    if isinstance(state, CompactState):  # The vectors are canonical within a layout, which the key keeps alive
+        return (state._layout, tuple(sorted((name, vector.tobytes()) for (name, vector) in state._vectors.items())),
+                tuple(sorted(state._constants.items(), key=lambda item: item[0])))
+    variables = state_variables(state)
+    frozen = state.__dict__.get('_statics') if isinstance(state, State) else None
+    if frozen is not None:  # Static variables are the same for the whole problem
+        return frozenset([('__statics__', frozen[0])] + [(name, _freeze(value)) for (name, value) in variables.items()
+                                                          if name != '__name__' and name not in frozen[1]])
+    return frozenset((name, _freeze(value)) for (name, value) in variables.items() if name != '__name__')
+
+
+def _freeze(value):
+    """Return a hashable equivalent of a state variable value."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return frozenset((k, _freeze(v)) for (k, v) in value.items())
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class TranspositionTable(object):
+    """
+    A bounded table of subproblems, i.e. (state, goal agenda) pairs, that are
+    known to have no plan. When the search reaches one of them again through
+    a different ordering of methods and operators it backtracks at once.
+    Entries are grouped by the hash of their state and their goals; the
+    least recently used groups are evicted beyond maxsize of them.
+    hits and misses count the lookups that did and did not prune the search.
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._failed = OrderedDict()
+
+    def __len__(self):
+        return len(self._failed)
+
+    def __repr__(self):
+        return '<TranspositionTable entries={} hits={} misses={}>'.format(len(self), self.hits, self.misses)
+
+    def key(self, state, goals):
+        """
+        Return the table key of the subproblem of achieving goals from state.
+        States and compact states hash incrementally, so their key holds the
+        hash and the state itself, which is only compared in full when a
+        failure with the same hash and goals is known.
+        """
+        if isinstance(state, (State, CompactState)):
+            return hash(state), tuple(goals), state
+        return state_key(state), tuple(goals), None
+
+    def failed(self, key):
+        """True if the subproblem key is known to have no plan."""
+        bucket = self._failed.get(key[:2])
+        if bucket is not None and (key[2] is None or state_key(key[2]) in bucket):
+            self._failed.move_to_end(key[:2])
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def record_failure(self, key):
+        """Remember that the subproblem key has no plan."""
+        # The state is snapshot now: a search in place goes on to change it
+        snapshot = state_key(key[2]) if key[2] is not None else None
+        bucket = self._failed.get(key[:2])
+        if bucket is None:
+            self._failed[key[:2]] = bucket = set()
+        bucket.add(snapshot)
+        self._failed.move_to_end(key[:2])
+        if len(self._failed) > self.maxsize:
+            self._failed.popitem(last=False)
+
+    def clear(self):
+        self._failed.clear()
+        self.hits = self.misses = 0
+
+
+############################################################
+# Search statistics, tracing and budgets
+class SearchStats(object):
+    """
+    Statistics of one search. Pass an instance to pyhop as stats to have it
+    filled in; collecting them costs nothing when no stats are requested.
+    operators and methods map the name of each function called to a list
+    [calls, successful calls, total seconds].
+    """
+    def __init__(self):
+        self.nodes = 0          # Nodes expanded
+        self.max_depth = 0      # Depth of the deepest node expanded
+        self.cutoffs = 0        # Nodes not expanded because of the depth limit
+        self.cycles = 0         # Nodes whose state and goal repeat those of a node above them
+        self.backtracks = 0     # Nodes whose choices all failed
+        self.satisfied = 0      # Goals skipped because they already held
+        self.copies = 0         # States copied for operators
+        self.copy_time = 0.0    # Seconds spent copying states
+        self.operators = {}
+        self.methods = {}
+        self.started = time.time()
+        self.elapsed = 0.0      # Seconds spent searching
+
+    def __repr__(self):
+        return '<SearchStats nodes={} backtracks={} max_depth={} elapsed={:.6f}>'.format(
+            self.nodes, self.backtracks, self.max_depth, self.elapsed)
+
+    def as_dict(self):
+        """Return the statistics as a dict of plain values, e.g. for json.dumps."""
+        def calls(table):
+            return dict((name, {'calls': c, 'succeeded': ok, 'time': round(t, 6)}) for (name, (c, ok, t)) in table.items())
+        return {'nodes': self.nodes, 'max_depth': self.max_depth, 'cutoffs': self.cutoffs, 'cycles': self.cycles,
+                'backtracks': self.backtracks, 'satisfied': self.satisfied, 'copies': self.copies,
+                'copy_time': round(self.copy_time, 6), 'elapsed': round(self.elapsed, 6),
+                'operators': calls(self.operators), 'methods': calls(self.methods)}
+
+    def print_stats(self):
+        """Print the statistics, with the operators and methods that took the most time first."""
+        print('nodes {}  backtracks {}  max depth {}  cutoffs {}  cycles {}  satisfied {}  elapsed {:.6f}s'.format(
+            self.nodes, self.backtracks, self.max_depth, self.cutoffs, self.cycles, self.satisfied, self.elapsed))
+        print('state copies {}  copy time {:.6f}s'.format(self.copies, self.copy_time))
+        print('{:<28}{:>10}{:>12}{:>14}'.format('OPERATOR/METHOD:', 'CALLS:', 'SUCCEEDED:', 'SECONDS:'))
+        rows = list(self.operators.items()) + list(self.methods.items())
+        for name, (count, succeeded, seconds) in sorted(rows, key=lambda row: -row[1][2]):
+            print('{:<28}{:>10}{:>12}{:>14.6f}'.format(name, count, succeeded, seconds))
+
+
+class Tracer(object):
+    """
+    Base class of search tracers. Pass an instance to pyhop as tracer and
+    the search calls these methods as it goes; override the ones you need.
+    """
+    def on_expand(self, depth, goal):
+        """A node is expanded; goal is its first goal, None if it has none left."""
+
+    def on_satisfied(self, depth, goal):
+        """goal already holds and is skipped."""
+
+    def on_cycle(self, depth, goal):
+        """goal is sought in the same state as by a node above, on the current path."""
+
+    def on_copy(self, depth, seconds):
+        """A state was copied to apply an operator."""
+
+    def on_operator(self, depth, operator, goal, newstate, seconds):
+        """operator was applied for goal; newstate is False if it was not applicable."""
+
+    def on_method(self, depth, method, goal, subgoals, seconds):
+        """method was called for goal; subgoals is falsy if it was not applicable."""
+
+    def on_backtrack(self, depth):
+        """All the choices of the node at depth failed."""
+
+
+class BudgetExhausted(object):
+    """
+    What pyhop returns when a search budget ran out before a plan was found.
+    reason is 'max_nodes', 'deadline' or 'max_depth' and stats holds the
+    SearchStats gathered so far. It is false in boolean context, like the
+    False returned when there is no plan, but can be told apart from it.
+    """
+    def __init__(self, reason, stats):
+        self.reason = reason
+        self.stats = stats
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<BudgetExhausted {} after {} nodes>'.format(self.reason, self.stats.nodes)
+
+
+class SearchStopped(Exception):
+    """Raised by seek_plan and seek_plan_iterative when their budget runs out or their stop function fires."""
+    def __init__(self, reason='stopped'):
+        Exception.__init__(self, reason)
+        self.reason = reason
+
+
+class _Monitor(object):
+    """
+    Watches one search: counts its nodes, enforces its budgets and feeds
+    its statistics and tracer. The engines only create one when one of
+    those is requested, so an unmonitored search pays nothing for it.
+    """
+    def __init__(self, max_nodes=None, max_depth=None, deadline=None, stop=None, stats=None, tracer=None,
+                 cycles=None):
+        if cycles not in (None, 'detect', 'prune'):
+            raise ValueError("cycles must be None, 'detect' or 'prune', not {!r}".format(cycles))
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.deadline = deadline
+        self.stop = stop
+        self.stats = stats if stats is not None else SearchStats()
+        self.tracer = tracer
+        self.timing = stats is not None or tracer is not None  # Whether to time operators and methods
+        self.cycles = cycles
+        self.path = []       # (hash of state, goal) of the nodes on the current path, by depth
+        self.on_path = {}    # The states, or undo marks, on the path under each of them
+        self.pruned = 0
+
+    def expand(self, depth, goal):
+        """
+        Count an expansion at depth. Return False if the node is beyond the
+        depth limit; raise SearchStopped if the search must stop altogether.
+        """
+        stats = self.stats
+        stats.nodes += 1
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+        if self.max_nodes is not None and stats.nodes > self.max_nodes:
+            raise SearchStopped('max_nodes')
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchStopped('deadline')
+        if self.stop is not None and self.stop():
+            raise SearchStopped()
+        if self.max_depth is not None and depth > self.max_depth:
+            stats.cutoffs += 1
+            return False
+        if self.tracer is not None:
+            self.tracer.on_expand(depth, goal)
+        return True
+
+    def visit(self, depth, state, goal):
+        """
+        Put the node at depth, which seeks goal in state, on the current
+        path, in place of the nodes at depth and below it that were there
+        before. Return False if cycles are pruned and the same goal is
+        already sought in an equal state above it.
+        """
+        if self.cycles is None:
+            return True
+        path = self.path
+        on_path = self.on_path
+        while len(path) > depth:
+            key = path.pop()
+            entries = on_path[key]
+            entries.pop()
+            if not entries:
+                del on_path[key]
+        key = (hash(state), goal)
+        entries = on_path.get(key)
+        if isinstance(state, UndoState):  # A search in place changes its one state, so the path keeps marks
+            snapshot = state.mark()
+            repeated = entries is not None and any(not state.changed_since(mark) for mark in entries)
+        else:
+            snapshot = state
+            repeated = entries is not None and state in entries
+        if repeated:
+            self.stats.cycles += 1
+            if self.tracer is not None:
+                self.tracer.on_cycle(depth, goal)
+            if self.cycles == 'prune':
+                self.pruned += 1
+                return False
+        path.append(key)
+        if entries is None:
+            on_path[key] = [snapshot]
+        else:
+            entries.append(snapshot)
+        return True
+
+    def incomplete(self):
+        """Return the number of nodes so far whose subtree was not searched: depth cutoffs and pruned cycles."""
+        return self.stats.cutoffs + self.pruned
+
+    def satisfied(self, depth, goal):
+        self.stats.satisfied += 1
+        if self.tracer is not None:
+            self.tracer.on_satisfied(depth, goal)
+
+    def copied(self, depth, seconds):
+        self.stats.copies += 1
+        self.stats.copy_time += seconds
+        if self.tracer is not None:
+            self.tracer.on_copy(depth, seconds)
+
+    def operator(self, depth, operator, goal, newstate, seconds):
+        _count_call(self.stats.operators, operator.__name__, newstate, seconds)
+        if self.tracer is not None:
+            self.tracer.on_operator(depth, operator, goal, newstate, seconds)
+
+    def method(self, depth, method, goal, subgoals, seconds):
+        _count_call(self.stats.methods, method.__name__, subgoals, seconds)
+        if self.tracer is not None:
+            self.tracer.on_method(depth, method, goal, subgoals, seconds)
+
+    def backtrack(self, depth):
+        self.stats.backtracks += 1
+        if self.tracer is not None:
+            self.tracer.on_backtrack(depth)
+
+
+def _make_monitor(stop, max_nodes, max_depth, deadline, stats, tracer, cycles=None):
+    """Return a _Monitor for a search with these options, or None if it needs none."""
+    if (stop is not None or max_nodes is not None or max_depth is not None or deadline is not None
+            or stats is not None or tracer is not None or cycles is not None):
+        return _Monitor(max_nodes, max_depth, deadline, stop, stats, tracer, cycles)
+    return None
+
+
+def _count_call(table, name, result, seconds):
+    counts = table.get(name)
+    if counts is None:
+        counts = table[name] = [0, 0, 0.0]
+    counts[0] += 1
+    if result:
+        counts[1] += 1
+    counts[2] += seconds
+
+
+############################################################
+# The actual planner
+def pyhop(state, goals, verbose=0, engine='recursive', table=None, stop=None,
+          max_nodes=None, max_depth=None, deadline=None, stats=None, tracer=None,
+          heuristic=None, cost=None, weight=3, on_plan=None, tree=False, cache=None, undo=False, cycles=_missing):
+    """
+    Try to find a plan that accomplishes tasks in state.
+    If successful, return the plan. Otherwise return False.
+    engine selects the search: 'recursive' (seek_plan) or 'iterative'
+    (seek_plan_iterative), which return the same first plan,
+    'best-first' (seek_plan_best_first), which looks for a cheap plan, or
+    'anytime' (seek_plan_anytime), which keeps improving on the first plan
+    until the search ends or a budget runs out and returns the best one,
+    calling on_plan with each improved plan if given; it prunes cycles
+    unless cycles is given, even as None (see seek_plan_anytime). heuristic and cost
+    are options of the last two, weight of 'best-first' only; table is
+    not an option of 'best-first', which drops repeated subproblems itself.
+    With tree, a depth-first engine returns the plan's decomposition tree
+    (a list of PlanNodes, one per goal) instead of the plan.
+    cache is an optional SubplanCache for the depth-first engines: plans
+    cached for a goal are tried first and the plans found are cached.
+    With undo, a depth-first search works on a single UndoState instead of
+    copying the state for each operator application; the operators must
+    modify and return the state they are given, as usual.
+    cycles='detect' makes a depth-first search count, in stats.cycles, the
+    nodes that seek the same goal in the same state as a node above them
+    on the current path; with cycles='prune' such nodes fail at once, so
+    that loops in a domain cost a backtrack instead of the whole search.
+    table is an optional TranspositionTable used to prune subproblems
+    that already failed; it may be shared between calls on the same domain.
+    stop is an optional function called before each node expansion; when
+    it returns True the search is abandoned and pyhop returns False.
+    max_nodes, max_depth and deadline (a time.time() value) bound the search.
+    When one of them runs out before a plan is found pyhop returns a
+    BudgetExhausted instead of False. Nodes deeper than max_depth are not
+    expanded, but the search goes on elsewhere. With stop or a budget, the
+    'recursive' engine is replaced by 'iterative', which finds the same
+    plan without Python's recursion limit, so that in a domain whose
+    methods loop the budget ends the search rather than a RecursionError.
+    stats is an optional SearchStats to fill in and tracer an optional
+    Tracer whose methods are called during the search.
+    """
+    if verbose > 0:
+        print('** hgn_pyhop, verbose={} **\n   state = {}\n   goals = {}'.format(verbose, state.__name__, goals))
+    if engine not in ('recursive', 'iterative', 'best-first', 'anytime'):
+        raise ValueError('unknown search engine {!r}'.format(engine))
+    if cycles is _missing:  # Not given: only the anytime search prunes cycles by default
+        cycles = 'prune' if engine == 'anytime' else None
+    if engine == 'best-first' and (tree or cache is not None or undo or cycles is not None or table is not None):
+        raise ValueError('the {} engine does not support this option'.format(engine))
+    state = _search_state(state)
+    monitor = _make_monitor(stop, max_nodes, max_depth, deadline, stats, tracer, cycles)
+    result = False
+    try:
+        if engine == 'recursive' and not (tree or cache is not None or undo) and (
+                stop is None and max_nodes is None and max_depth is None and deadline is None):
+            result = seek_plan(state, goals, [], 0, verbose, table, monitor)
+        elif engine in ('recursive', 'iterative'):
+            for result, _ in _search_plans(state, goals, verbose, table, monitor, tree=tree, cache=cache, undo=undo):
+                break
+        elif engine == 'best-first':
+            result = seek_plan_best_first(state, goals, verbose, monitor, heuristic, cost, weight)
+        else:
+            for result, _ in _search_plans(state, goals, verbose, table, monitor, heuristic, cost, True,
+                                           tree=tree, cache=cache, undo=undo):
+                if on_plan is not None:
+                    on_plan(result)
+        if result is False and monitor is not None and monitor.stats.cutoffs:
+            result = BudgetExhausted('max_depth', monitor.stats)
+    except SearchStopped as e:
+        if result is False:  # An anytime search keeps the best plan found so far
+            result = False if e.reason == 'stopped' else BudgetExhausted(e.reason, monitor.stats)
+    if monitor is not None:
+        monitor.stats.elapsed = time.time() - monitor.stats.started
+    if verbose > 0:
+        print('** result =', result, '\n')
+    return result
+
+
+def relevant_choices(state, goal1, depth, verbose=0, monitor=None, in_place=False):
+    """
+    Generate the ways of achieving goal1 in state, in the order pyhop tries
+    them: skip goal1 if it already holds, then apply each relevant operator,
+    then each relevant method. Each choice is a tuple
+    (kind, newstate, subgoals, action, via) where kind is 'satisfied',
+    'operator' or 'method', action is None unless kind is 'operator' and
+    via is the operator or method used, if any.
+    With in_place, state is an UndoState that operators modify directly
+    and newstate is state itself; before asking for the next choice the
+    caller must roll state back to where it was when the first was asked.
+    """
+    timing = monitor is not None and monitor.timing
+    if _peek(state, goal1[0])[goal1[1]] == goal1[2]:  # Check whether goal1 is already satisfied
+        if verbose > 2:
             print('depth {} new state: no actions taken'.format(depth))
             print_state(state)
-        solution = seek_plan(state, goals[1:], plan, depth + 1, verbose)
-        if solution is not False:
-            return solution
+        if monitor is not None:
+            monitor.satisfied(depth, goal1)
+        yield 'satisfied', state, [], None, None
+    relevant_operators, relevant_methods = relevant_declarations(state, goal1)
     if goal1[0] in operators:
-        relevant = operators[goal1[0]]
-        for operator in relevant:  # Look for relevant operators that are applicable
-            newstate = operator(copy.deepcopy(state), *goal1[1:])
+        mark = state.mark() if in_place else None
+        for operator in relevant_operators:  # Look for relevant operators that are applicable
+            apply = operator
+            applicable = getattr(operator, 'applicable', None)
+            if applicable is not None:  # A schema: check the preconditions before copying the state
+                if timing:
+                    started = time.perf_counter()
+                if not _on(state, applicable, goal1[1:]):
+                    if timing:
+                        monitor.operator(depth, operator, goal1, False, time.perf_counter() - started)
+                    continue
+                apply = operator.effects
+            if in_place:
+                if timing:
+                    started = time.perf_counter()
+                    newstate = apply(state, *goal1[1:])
+                    monitor.operator(depth, operator, goal1, newstate, time.perf_counter() - started)
+                else:
+                    newstate = apply(state, *goal1[1:])
+                if not newstate:  # Undo whatever the operator wrote before giving up
+                    state.rollback(mark)
+            elif timing:
+                started = time.perf_counter()
+                copied = copy_state(state)
+                applied = time.perf_counter()
+                newstate = _on(copied, apply, goal1[1:])
+                monitor.copied(depth, applied - started)
+                monitor.operator(depth, operator, goal1, newstate, time.perf_counter() - applied)
+            else:
+                newstate = _on(copy_state(state), apply, goal1[1:])
             if newstate:
+                action = (operator.__name__,) + goal1[1:]
                 if verbose > 2:
-                    print('depth {} action {}'.format(depth, (operator.__name__,) + goal1[1:]))
+                    print('depth {} action {}'.format(depth, action))
                     print('depth {} new state:'.format(depth))
                     print_state(newstate)
-                solution = seek_plan(newstate, goals[1:], plan + [(operator.__name__,) + goal1[1:]], depth + 1, verbose)
-                if solution:
-                    return solution
+                yield 'operator', newstate, [], action, operator
     if goal1[0] in methods:
         if verbose > 2:
             print('depth {} method instance {}'.format(depth, goal1))
-        relevant = methods[goal1[0]]
-        for method in relevant:  # Look for relevant methods that are applicable
-            subgoals = method(state, *goal1[1:])
+        for method in relevant_methods:  # Look for relevant methods that are applicable
+            if timing:
+                started = time.perf_counter()
+                subgoals = _on(state, method, goal1[1:])
+                monitor.method(depth, method, goal1, subgoals, time.perf_counter() - started)
+            else:
+                subgoals = _on(state, method, goal1[1:])
             if verbose > 2:
                 print('depth {} new goals: {}'.format(depth, subgoals))
-            if subgoals:
-                solution = seek_plan(state, subgoals + goals[1:], plan, depth + 1, verbose)
-                if solution:
-                    return solution
+            if isinstance(subgoals, Alternatives):
+                for alternative in subgoals:
+                    if alternative:
+                        yield 'method', state, alternative, None, method
+            elif subgoals:
+                yield 'method', state, subgoals, None, method
+
+
+def seek_plan(state, goals, plan, depth, verbose=0, table=None, monitor=None):
+    """
+    Workhorse for pyhop. state and tasks are as in pyhop.
+    - plan is the current partial plan.
+    - depth is the recursion depth, for use in debugging
+    - verbose is whether to print debugging messages
+    - table is an optional TranspositionTable of failed subproblems
+    - monitor is an optional _Monitor of budgets, statistics and tracer;
+      SearchStopped is raised when a budget runs out
+    """
+    if monitor is not None:
+        if not monitor.expand(depth, goals[0] if goals else None):
+            if verbose > 2:
+                print('depth {} returns failure: depth limit'.format(depth))
+            return False
+        cutoffs = monitor.incomplete()
+    if verbose > 1:
+        print('depth {} goals {}'.format(depth, goals))
+    if goals == []:
+        if verbose > 2:
+            print('depth {} returns plan {}'.format(depth, plan))
+        return plan
+    if table is not None:
+        key = table.key(state, goals)
+        if table.failed(key):
+            if verbose > 2:
+                print('depth {} returns known failure'.format(depth))
+            return False
+    if monitor is not None and not monitor.visit(depth, state, goals[0]):
+        if verbose > 2:
+            print('depth {} returns failure: cycle'.format(depth))
+        return False
+    for kind, newstate, subgoals, action, _ in relevant_choices(state, goals[0], depth, verbose, monitor):
+        newplan = plan + [action] if action else plan
+        solution = seek_plan(newstate, subgoals + goals[1:], newplan, depth + 1, verbose, table, monitor)
+        if solution or (kind == 'satisfied' and solution is not False):
+            return solution
     if verbose > 2:
         print('depth {} returns failure'.format(depth))
+    if monitor is not None:
+        monitor.backtrack(depth)
+    if table is not None and (monitor is None or monitor.incomplete() == cutoffs):
+        table.record_failure(key)  # Failures below a depth cutoff or a pruned cycle may not be failures elsewhere
+    return False
+
+
+def seek_plan_iterative(state, goals, verbose=0, table=None, monitor=None, tree=False, cache=None, in_place=False):
+    """
+    Same search as seek_plan, but driven by an explicit stack of choice
+    points instead of Python recursion, so plans with thousands of steps
+    neither hit the recursion limit nor copy goal lists and plans at every
+    level. The goal agenda and the plan are linked lists of (head, tail)
+    pairs that share their tails, which keeps memory linear in the depth.
+    With tree, the decisions taken are recorded as well and the result is
+    the decomposition tree of the plan (a list of PlanNodes, one per goal).
+    With a SubplanCache, a cached plan for a goal is tried before anything
+    else except skipping the goal if it holds.
+    With in_place, state is an UndoState that operators modify directly;
+    each choice point remembers the position in its undo log and rolls the
+    state back to it before trying its next choice.
+    The search is that of seek_plans, stopped at its first plan.
+    """
+    for plan, _ in seek_plans(state, goals, verbose, table, monitor, tree=tree, cache=cache, in_place=in_place):
+        return plan
+    return False
+
+
+def seek_plan_best_first(state, goals, verbose=0, monitor=None, heuristic=None, cost=None, weight=3):
+    """
+    Best-first (weighted A*) search for a cheap plan. Instead of committing
+    to the first applicable operator or method, keep a priority queue of
+    partial plans ranked by cost(plan) + weight * heuristic(state,
+    remaining goals) and always expand the most promising one. Partial
+    plans that reach a state and goals already reached at no higher cost
+    are dropped.
+    - heuristic(state, goals) estimates the cost of achieving goals in
+      state; the default, goals_estimate, uses the heuristics declared with
+      declare_heuristic
+    - cost(action) is the cost of an action, 1 by default
+    - weight trades plan quality for fewer expansions; weight=1 is plain
+      A*, which on the example domains finds plans no cheaper than the
+      default weight 3 but runs out of a budget of 50000 nodes on logistics
+      problems of 20 packages, which weight 3 solves in a few hundred
+    The search can only choose among the decompositions the domain's
+    methods offer.
+    """
+    heuristic = heuristic or goals_estimate
+    agenda = None
+    for goal in reversed(goals):
+        agenda = (goal, agenda)
+    order = itertools.count()
+    queue = [(weight * _on(state, heuristic, (goals,)), 0, next(order), 0, state, agenda, None)]
+    reached = {}
+    while queue:
+        f, negdepth, _, g, state, agenda, plan = heapq.heappop(queue)
+        depth = -negdepth
+        if monitor is not None and not monitor.expand(depth, agenda[0] if agenda is not None else None):
+            continue
+        if verbose > 1:
+            print('depth {} f {} goals {}'.format(depth, f, _linked_list(agenda)))
+        if agenda is None:
+            plan = _linked_list(plan)[::-1]
+            if verbose > 2:
+                print('depth {} returns plan {} of cost {}'.format(depth, plan, g))
+            return plan
+        for kind, newstate, subgoals, action, _ in relevant_choices(state, agenda[0], depth, verbose, monitor):
+            newagenda = agenda[1]
+            for goal in reversed(subgoals):
+                newagenda = (goal, newagenda)
+            newg, newplan = g, plan
+            if action:
+                newg = g + (cost(action) if cost is not None else 1)
+                newplan = (action, plan)
+            try:  # States hash incrementally and only compare their bindings when the hashes are equal
+                key = (newstate if isinstance(newstate, (State, CompactState)) else state_key(newstate),
+                       tuple(_linked_list(newagenda)))
+                if reached.get(key, newg + 1) <= newg:
+                    continue
+                reached[key] = newg
+            except TypeError:  # Unhashable goals
+                pass
+            h = _on(newstate, heuristic, (_linked_list(newagenda),))
+            # Among equally promising plans prefer the deepest, as the depth-first engines do
+            heapq.heappush(queue, (newg + weight * h, -(depth + 1), next(order), newg, newstate, newagenda, newplan))
+    if verbose > 2:
+        print('best-first search returns failure')
     return False
+
+
+def seek_plan_anytime(state, goals, verbose=0, table=None, monitor=None, heuristic=None, cost=None):
+    """
+    Depth-first branch and bound. Generate a (plan, cost) pair as soon as a
+    plan is found, then keep searching and generate each plan that is
+    strictly cheaper than the previous one, until the search space is
+    exhausted or the monitor stops the search.
+    The first plan is the one seek_plan_iterative returns.
+    The bound only prunes on cost, so a loop of methods that adds no
+    actions, such as one that asks for the goal it was called for, goes on
+    forever unless the monitor prunes cycles (cycles='prune'), as
+    pyhop_anytime and pyhop(...,engine='anytime') do by default. Then the
+    last plan is the cheapest of the plans that never seek a goal in the
+    state in which a node above sought it, which need not be the cheapest
+    plan of all.
+    - cost(action) is the cost of an action, 1 by default
+    - a partial plan is abandoned once its cost plus heuristic(state, goals)
+      reaches the cost of the best plan, so heuristic must not overestimate;
+      by default the remaining goals are assumed to cost nothing
+    - with a table, subproblems that failed regardless of the bound are
+      pruned, as in seek_plan_iterative
+    """
+    return seek_plans(state, goals, verbose, table, monitor, heuristic, cost, improve=True)
+
+
+def seek_plans(state, goals, verbose=0, table=None, monitor=None, heuristic=None, cost=None, improve=False,
+               pause=None, tree=False, cache=None, in_place=False):
+    """
+    Generate (plan, cost) pairs for every plan depth-first search finds, in
+    the order seek_plan_iterative would find them. The search is suspended
+    while the caller handles a plan and resumes from the choice point where
+    it stopped, so each further plan only costs the additional search.
+    Different decompositions may lead to the same plan. With improve, only
+    plans cheaper than the previous one are generated (seek_plan_anytime).
+    With pause, None is also generated after every pause nodes, so that the
+    caller can do other work between steps of a long search. tree, cache
+    and in_place are those of seek_plan_iterative; with tree, the plans
+    are generated as decomposition trees.
+    """
+    agenda = None
+    for goal in reversed(goals):
+        agenda = (goal, agenda)
+    plan = None
+    trace = None
+    g = 0
+    depth = 0
+    stack = []
+    best = None
+    bounded = 0  # Number of plans found and subproblems cut off by the bound
+    steps = 0
+    while True:
+        if pause is not None:
+            steps += 1
+            if steps == pause:
+                steps = 0
+                yield None
+        expand = monitor is None or monitor.expand(depth, agenda[0] if agenda is not None else None)
+        if verbose > 1 and expand:
+            print('depth {} goals {}'.format(depth, _linked_list(agenda)))
+        key = None
+        if not expand:
+            if verbose > 2:
+                print('depth {} returns failure: depth limit'.format(depth))
+        elif improve and best is not None and g + (_on(state, heuristic, (_linked_list(agenda),)) if heuristic is not None else 0) >= best:
+            bounded += 1
+            if verbose > 2:
+                print('depth {} returns failure: cost bound {}'.format(depth, best))
+        elif agenda is None:
+            best = g
+            bounded += 1
+            result = _linked_list(plan)[::-1]
+            if verbose > 2:
+                print('depth {} returns plan {} of cost {}'.format(depth, result, g))
+            yield (tree_from_records(_linked_list(trace)[::-1]) if tree else result), g
+        else:
+            if table is not None:
+                key = table.key(state, _linked_list(agenda))
+            if key is not None and table.failed(key):
+                if verbose > 2:
+                    print('depth {} returns known failure'.format(depth))
+            elif monitor is not None and not monitor.visit(depth, state, agenda[0]):
+                if verbose > 2:
+                    print('depth {} returns failure: cycle'.format(depth))
+            else:
+                incomplete = bounded + (monitor.incomplete() if monitor is not None else 0)
+                choices = relevant_choices(state, agenda[0], depth, verbose, monitor, in_place)
+                if cache is not None and agenda[0][0] in methods:
+                    cached = cache.lookup(state, agenda[0])
+                    if cached is not None:
+                        if verbose > 2:
+                            print('depth {} cached plan {}'.format(depth, cached[1]))
+                        newstate, actions, records = cached
+                        choices = itertools.chain([('cached', newstate, [], actions, records)], choices)
+                stack.append((choices, agenda, plan, trace, g, depth, key, incomplete,
+                              state.mark() if in_place else None))
+        while stack:  # Backtrack to the most recent choice point that has an untried choice
+            choices, agenda, plan, trace, g, depth, key, incomplete, mark = stack[-1]
+            if in_place:
+                state.rollback(mark)
+            choice = next(choices, None)
+            if choice is not None:
+                break
+            if verbose > 2:
+                print('depth {} returns failure'.format(depth))
+            if monitor is not None:
+                monitor.backtrack(depth)
+            # A subproblem whose search was not cut short, and found no plan, has no plan at all
+            if key is not None and bounded + (monitor.incomplete() if monitor is not None else 0) == incomplete:
+                table.record_failure(key)
+            stack.pop()
+        else:
+            return
+        kind, newstate, subgoals, action, via = choice
+        if kind == 'cached' and in_place:  # newstate is a copy, apply the plan to state itself
+            _replay_records(state, via, in_place)
+        else:
+            state = newstate
+        if kind == 'cached':  # action holds the actions of the cached plan and via its tree records
+            for record in via:
+                trace = (record, trace)
+            for cached_action in action:
+                plan = (cached_action, plan)
+                g += cost(cached_action) if cost is not None else 1
+            action = None
+        elif tree:
+            trace = ((agenda[0], kind, via.__name__ if via is not None else None, len(subgoals)), trace)
+        agenda = agenda[1]
+        for goal in reversed(subgoals):
+            agenda = (goal, agenda)
+        if action:
+            plan = (action, plan)
+            g += cost(action) if cost is not None else 1
+        depth += 1
+
+
+def _search_plans(state, goals, verbose, table, monitor, heuristic=None, cost=None, improve=False, pause=None,
+                  tree=False, cache=None, undo=False):
+    """
+    seek_plans with the options of pyhop: with undo it searches an
+    UndoState, with cache it caches the plans found, and it generates
+    (plan, cost) pairs, or (decomposition tree, cost) pairs with tree.
+    """
+    records = tree or cache is not None
+    for found in seek_plans(UndoState(state) if undo else state, goals, verbose, table, monitor, heuristic, cost,
+                            improve, pause, records, cache, undo):
+        if found is not None:
+            if cache is not None:
+                cache.store(state, found[0])
+            if records and not tree:
+                found = tree_plan(found[0]), found[1]
+        yield found
+
+
+def pyhop_anytime(state, goals, verbose=0, table=None, stop=None, max_nodes=None, max_depth=None,
+                  deadline=None, stats=None, tracer=None, heuristic=None, cost=None, tree=False, cache=None,
+                  undo=False, cycles='prune'):
+    """
+    Anytime planning: generate the first plan pyhop finds as soon as it is
+    found, then each plan that is strictly cheaper than the previous one.
+    The generator ends when no cheaper plan exists or when a budget
+    (stop, max_nodes, max_depth, deadline) runs out; the caller may also
+    simply stop iterating. Cycles are pruned by default, since the search
+    only ends in domains whose methods loop if they are; see
+    seek_plan_anytime. The other arguments are those of pyhop.
+    """
+    return _generate_plans('anytime', state, goals, verbose, table, stop, max_nodes, max_depth, deadline,
+                           stats, tracer, heuristic, cost, True, tree, cache, undo, cycles)
+
+
+def iter_plans(state, goals, verbose=0, table=None, stop=None, max_nodes=None, max_depth=None,
+               deadline=None, stats=None, tracer=None, distinct=False, tree=False, cache=None, undo=False,
+               cycles=None):
+    """
+    Generate the plans that accomplish goals in state lazily, starting with
+    the one pyhop returns. Asking for the next plan resumes the backtracking
+    search where the previous plan was found instead of starting over.
+    The generator ends when the search space or a budget (stop, max_nodes,
+    max_depth, deadline) runs out; the caller may stop iterating at any
+    point. Different decompositions may lead to the same plan; with
+    distinct, each plan is generated only once. The other arguments are
+    those of pyhop.
+    """
+    plans = _generate_plans('iter_plans', state, goals, verbose, table, stop, max_nodes, max_depth, deadline,
+                            stats, tracer, None, None, False, tree, cache, undo, cycles)
+    return _distinct_plans(plans) if distinct else plans
+
+
+def pyhop_steps(state, goals, verbose=0, pause=100, table=None, stop=None, max_nodes=None, max_depth=None,
+                deadline=None, stats=None, tracer=None, tree=False, cache=None, undo=False, cycles=None):
+    """
+    Run the search of pyhop(...,engine='iterative') in steps: generate None
+    after every pause nodes and, last, what pyhop would return. The caller
+    may do other work between steps, or stop iterating to abandon the
+    search. The other arguments are those of pyhop.
+    """
+    if verbose > 0:
+        print('** hgn_pyhop steps, verbose={} **\n   state = {}\n   goals = {}'.format(verbose, state.__name__, goals))
+    state = _search_state(state)
+    monitor = _make_monitor(stop, max_nodes, max_depth, deadline, stats, tracer, cycles)
+    result = False
+    try:
+        for found in _search_plans(state, goals, verbose, table, monitor, pause=pause, tree=tree, cache=cache,
+                                   undo=undo):
+            if found is None:
+                yield None
+            else:
+                result = found[0]
+                break
+        if result is False and monitor is not None and monitor.stats.cutoffs:
+            result = BudgetExhausted('max_depth', monitor.stats)
+    except SearchStopped as e:
+        result = False if e.reason == 'stopped' else BudgetExhausted(e.reason, monitor.stats)
+    finally:
+        if monitor is not None:
+            monitor.stats.elapsed = time.time() - monitor.stats.started
+    if verbose > 0:
+        print('** result =', result, '\n')
+    yield result
+
+
+def _distinct_plans(plans):
+    seen = set()
+    for plan in plans:
+        key = tuple(tree_plan(plan) if plan and isinstance(plan[0], PlanNode) else plan)
+        if key not in seen:
+            seen.add(key)
+            yield plan
+
+
+def _generate_plans(name, state, goals, verbose, table, stop, max_nodes, max_depth, deadline,
+                    stats, tracer, heuristic, cost, improve, tree, cache, undo, cycles):
+    if verbose > 0:
+        print('** hgn_pyhop {}, verbose={} **\n   state = {}\n   goals = {}'.format(name, verbose, state.__name__, goals))
+    state = _search_state(state)
+    monitor = _make_monitor(stop, max_nodes, max_depth, deadline, stats, tracer, cycles)
+    try:
+        for plan, plan_cost in _search_plans(state, goals, verbose, table, monitor, heuristic, cost, improve,
+                                             tree=tree, cache=cache, undo=undo):
+            if verbose > 0:
+                print('** plan of cost {} = {}'.format(plan_cost, plan))
+            yield plan
+    except SearchStopped as e:
+        if verbose > 0:
+            print('** search stopped: {}'.format(e.reason))
+    finally:
+        if monitor is not None:
+            monitor.stats.elapsed = time.time() - monitor.stats.started
+
+
+def _linked_list(cells):
+    """Return the items of a linked list of (head, tail) pairs as a list."""
+    items = []
+    while cells is not None:
+        items.append(cells[0])
+        cells = cells[1]
+    return items
+
+
+############################################################
+# Decomposition trees and replanning
+
+class PlanNode(object):
+    """
+    A goal of a decomposition tree and how the plan achieves it. kind is
+    'satisfied' if the goal already held, 'operator' or 'method'; name is
+    the name of the operator or method and children are the nodes of the
+    method's subgoals.
+    """
+    __slots__ = ('goal', 'kind', 'name', 'children')
+
+    def __init__(self, goal, kind, name=None, children=()):
+        self.goal = goal
+        self.kind = kind
+        self.name = name
+        self.children = children
+
+    @property
+    def action(self):
+        """The action of an operator node, None for other nodes."""
+        if self.kind == 'operator':
+            return (self.name,) + tuple(self.goal[1:])
+        return None
+
+    def __eq__(self, other):
+        return (isinstance(other, PlanNode) and self.goal == other.goal and self.kind == other.kind
+                and self.name == other.name and list(self.children) == list(other.children))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self.children:
+            return 'PlanNode({!r}, {!r}, {!r}, {!r})'.format(self.goal, self.kind, self.name, self.children)
+        return 'PlanNode({!r}, {!r}, {!r})'.format(self.goal, self.kind, self.name)
+
+
+def tree_plan(nodes):
+    """Return the plan of a decomposition tree: the actions of its operator nodes, in order."""
+    plan = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if node.kind == 'operator':
+            plan.append(node.action)
+        else:
+            stack.extend(reversed(node.children))
+    return plan
+
+
+def tree_records(nodes):
+    """
+    Flatten a decomposition tree into records (goal, kind, name, number of
+    children), one per node in preorder. This is also the order in which
+    seek_plan_iterative takes its decisions; tree_from_records rebuilds
+    the tree.
+    """
+    records = []
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        records.append((node.goal, node.kind, node.name, len(node.children)))
+        stack.extend(reversed(node.children))
+    return records
+
+
+def tree_from_records(records):
+    """Build a decomposition tree from the records tree_records returns."""
+    roots = []
+    frames = [[roots, -1]]  # (children, number of children still to come)
+    for goal, kind, name, count in records:
+        node = PlanNode(goal, kind, name, [] if count else ())
+        frame = frames[-1]
+        frame[0].append(node)
+        frame[1] -= 1
+        if frame[1] == 0:
+            frames.pop()
+        if count:
+            frames.append([node.children, count])
+    return roots
+
+
+_kind_codes = {'satisfied': 's', 'operator': 'o', 'method': 'm'}
+_code_kinds = dict((code, kind) for kind, code in _kind_codes.items())
+
+
+def dump_trees(trees, file, format='jsonl'):
+    """
+    Write decomposition trees to an open file, one record per tree:
+    - format 'jsonl' writes a line of JSON per tree to a text file; goal
+      values must be JSON values, and lists in them are read back as lists
+    - format 'pickle' writes to a binary file, which is more compact and
+      faster to load, and keeps any picklable goal values as they are
+    Each tree is stored as its tree_records, not as nested objects.
+    """
+    if format == 'jsonl':
+        for tree in trees:
+            records = [[list(goal), _kind_codes[kind], name, count] for goal, kind, name, count in tree_records(tree)]
+            file.write(json.dumps(records, separators=(',', ':')))
+            file.write('\n')
+    elif format == 'pickle':
+        for tree in trees:
+            pickle.dump(tree_records(tree), file, pickle.HIGHEST_PROTOCOL)
+    else:
+        raise ValueError('unknown tree format {!r}'.format(format))
+
+
+def load_trees(file, format='jsonl'):
+    """
+    Generate the decomposition trees dump_trees wrote to file, in order.
+    Only load pickled trees from files you trust.
+    """
+    if format == 'jsonl':
+        for line in file:
+            if line.strip():
+                yield tree_from_records((tuple(goal), _code_kinds[code], name, count)
+                                        for goal, code, name, count in json.loads(line))
+    elif format == 'pickle':
+        while True:
+            try:
+                records = pickle.load(file)
+            except EOFError:
+                return
+            yield tree_from_records(records)
+    else:
+        raise ValueError('unknown tree format {!r}'.format(format))
+
+
+def _tree_size(node):
+    """Return the number of actions in the tree below node."""
+    size = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.kind == 'operator':
+            size += 1
+        else:
+            stack.extend(node.children)
+    return size
+
+
+def _declared(declarations, goal, name):
+    """Return the operator or method called name declared for goal's variable, or None."""
+    for function in declarations.get(goal[0], ()):
+        if function.__name__ == name:
+            return function
+    return None
+
+
+def _decomposes(subgoals, recorded):
+    """Whether the subgoals a method returns (possibly Alternatives) include the recorded ones."""
+    if isinstance(subgoals, Alternatives):
+        return any(list(alternative) == recorded for alternative in subgoals)
+    return bool(subgoals) and list(subgoals) == recorded
+
+
+def replan(state, tree, delta=None, executed=0, verbose=0, table=None, stop=None,
+           max_nodes=None, max_depth=None, deadline=None, stats=None, tracer=None):
+    """
+    Repair a plan after the world changed, given its decomposition tree
+    (pyhop(..., tree=True)). Return the repaired tree, or False or a
+    BudgetExhausted as pyhop does; tree_plan(result) is the new plan.
+    - state is the current state of the world; delta is an optional dict
+      {variable: {key: value}} of changes to apply to it first
+    - executed is the number of the plan's actions already carried out
+    The tree is replayed against state. Nodes whose goals still hold,
+    whose operators still apply and whose methods still give the same
+    subgoals are kept; only the goals of the others are searched again,
+    from the state they now start in. If such a goal has no plan, its
+    parent's goal is searched instead, and so on up to the remaining
+    top-level goals, so the search effort grows with the extent of the
+    change rather than with the size of the problem.
+    The other arguments are those of pyhop.
+    """
+    if verbose > 0:
+        print('** hgn_pyhop replan, verbose={} **\n   state = {}\n   delta = {}\n   executed = {}'.format(
+            verbose, state.__name__, delta, executed))
+    if delta:
+        state = copy_state(state)
+        for name, changes in delta.items():
+            values = getattr(state, name)
+            for key, value in changes.items():
+                values[key] = value
+    state = _search_state(state)
+    monitor = _make_monitor(stop, max_nodes, max_depth, deadline, stats, tracer)
+    repair = _Repair(verbose, table, monitor)
+    try:
+        result = repair.goals(tree, state, executed)
+        if result is None:
+            result = False
+            if monitor is not None and monitor.stats.cutoffs:
+                result = BudgetExhausted('max_depth', monitor.stats)
+    except SearchStopped as e:
+        result = False if e.reason == 'stopped' else BudgetExhausted(e.reason, monitor.stats)
+    if monitor is not None:
+        monitor.stats.elapsed = time.time() - monitor.stats.started
+    if verbose > 0:
+        print('** result =', result if result is False or isinstance(result, BudgetExhausted) else tree_plan(result),
+              '\n   goals searched again = {}\n'.format(repair.searched))
+    return result
+
+
+class _Repair(object):
+    """Replays a decomposition tree against a changed state, for replan."""
+    def __init__(self, verbose, table, monitor):
+        self.verbose = verbose
+        self.table = table
+        self.monitor = monitor
+        self.searched = 0
+
+    def goals(self, roots, state, skip):
+        """
+        Repair the top-level nodes; return the new ones or None. When one
+        of them has no plan any more, search for the goals from there on,
+        then for all the goals not carried out yet, and last for all the
+        goals from the current state, as planning from scratch would.
+        """
+        current = state
+        repaired = []
+        pending = None  # Index and state of the first top-level goal not carried out yet
+        for i, node in enumerate(roots):
+            result = self.node(node, state, skip)
+            if result is None:
+                if pending is None:
+                    pending = i, state
+                attempts = [(i, state), pending, (0, current)]
+                for j, (start, start_state) in enumerate(attempts):
+                    if (start, start_state) in attempts[:j]:
+                        continue
+                    nodes = self.search([node.goal for node in roots[start:]], start_state)
+                    if nodes is not None:
+                        return repaired[:max(start - pending[0], 0)] + nodes
+                return None
+            newnode, newstate, skip = result
+            if newnode is not None:
+                if pending is None:
+                    pending = i, state
+                repaired.append(newnode)
+            state = newstate
+        return repaired
+
+    def nodes(self, nodes, state, skip):
+        """Repair sibling nodes in turn; return (nodes, state, skip) or None."""
+        repaired = []
+        for node in nodes:
+            result = self.node(node, state, skip)
+            if result is None:
+                return None
+            newnode, state, skip = result
+            if newnode is not None:
+                repaired.append(newnode)
+        return repaired, state, skip
+
+    def node(self, node, state, skip):
+        """
+        Repair the subtree of node, skipping its first skip actions, which
+        were carried out already. Return (node, state after it, actions
+        still to skip), where node is None if it was carried out entirely,
+        or None if its goal has no plan any more.
+        """
+        goal = node.goal
+        if skip:
+            size = _tree_size(node)
+            if skip >= size:
+                return None, state, skip - size
+            result = self.nodes(node.children, state, skip)  # A method carried out in part
+            if result is not None:
+                children, state, skip = result
+                return PlanNode(goal, node.kind, node.name, children), state, skip
+        elif _peek(state, goal[0])[goal[1]] == goal[2]:
+            if node.kind != 'satisfied':
+                node = PlanNode(goal, 'satisfied')
+            return node, state, 0
+        elif node.kind == 'operator':
+            operator = _declared(operators, goal, node.name)
+            newstate = _on(copy_state(state), operator, goal[1:]) if operator is not None else False
+            if newstate:
+                return node, newstate, 0
+        elif node.kind == 'method':
+            method = _declared(methods, goal, node.name)
+            if method is not None and _decomposes(_on(state, method, goal[1:]), [child.goal for child in node.children]):
+                result = self.nodes(node.children, state, 0)
+                if result is not None:
+                    children, state, _ = result
+                    return PlanNode(goal, 'method', node.name, children), state, 0
+        nodes = self.search([goal], state)
+        if nodes is None:
+            return None
+        return nodes[0], _apply_tree(state, nodes), 0
+
+    def search(self, goals, state):
+        """Search for a plan for goals in state; return its decomposition tree or None."""
+        self.searched += 1
+        if self.verbose > 1:
+            print('replan: searching again for {}'.format(goals))
+        nodes = seek_plan_iterative(state, goals, self.verbose, self.table, self.monitor, tree=True)
+        return nodes if nodes is not False else None
+
+
+def _apply_tree(state, nodes):
+    """Return the state reached by applying the actions of a decomposition tree to state."""
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if node.kind == 'operator':
+            state = _on(copy_state(state), _declared(operators, node.goal, node.name), node.goal[1:])
+        else:
+            stack.extend(reversed(node.children))
+    return state
+
+
+############################################################
+# Subplan cache
+
+class SubplanCache(object):
+    """
+    A bounded cache of the plans found for goals, keyed by the goal and the
+    projection of the state it was achieved from (see declare_projection),
+    so that later searches, in the same or another process, can reuse them
+    instead of searching again. A cached plan is only used after replaying
+    its operators shows that it works and achieves the goal in the state at
+    hand. The least recently used entries are evicted beyond maxsize.
+    With a path, entries are also kept in an SQLite database there, which
+    is read on misses and written by flush and close; it keeps the maxsize
+    most recently stored entries.
+    hits, misses and stale count the lookups that found a working plan,
+    found nothing and found a plan that did not work.
+    """
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries = OrderedDict()
+        self._unsaved = {}
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS subplans (key TEXT PRIMARY KEY, records BLOB, stored REAL)')
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<SubplanCache entries={} hits={} misses={} stale={}>'.format(
+            len(self), self.hits, self.misses, self.stale)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def key(self, state, goal):
+        """Return the cache key of goal in state, or None if goal is not cached."""
+        projection = projections.get(goal[0])
+        view = projection(state, *goal[1:]) if projection is not None else state_key(state)
+        if view is None:
+            return None
+        return goal, view
+
+    def lookup(self, state, goal):
+        """
+        Return (state after the plan, its actions, its tree records) for a
+        cached plan that achieves goal in state, or None.
+        """
+        if _peek(state, goal[0])[goal[1]] == goal[2]:
+            return None
+        key = self.key(state, goal)
+        if key is None:
+            return None
+        records = self._entries.get(key)
+        if records is None and self._db is not None:
+            row = self._db.execute('SELECT records FROM subplans WHERE key = ?', (_digest(key),)).fetchone()
+            if row is not None:
+                records = pickle.loads(row[0])
+                self._remember(key, records)
+        if records is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        newstate = _replay_records(state, records)
+        if not newstate or getattr(newstate, goal[0])[goal[1]] != goal[2]:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return newstate, tuple(_records_plan(records)), records
+
+    def store(self, state, nodes):
+        """Cache the plan of each method node of a decomposition tree whose goals were achieved from state."""
+        stack = list(reversed(nodes))
+        while stack:
+            node = stack.pop()
+            if node.kind == 'operator':
+                state = _on(copy_state(state), _declared(operators, node.goal, node.name), node.goal[1:])
+            elif node.kind == 'method':
+                key = self.key(state, node.goal)
+                if key is not None and _tree_size(node):
+                    records = tuple(tree_records([node]))
+                    self._remember(key, records)
+                    if self._db is not None:
+                        self._unsaved[key] = records
+                stack.extend(reversed(node.children))
+
+    def _remember(self, key, records):
+        self._entries[key] = records
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def flush(self):
+        """Write the entries stored since the last flush to the database."""
+        if self._db is None or not self._unsaved:
+            return
+        now = time.time()
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO subplans VALUES (?, ?, ?)',
+                                 [(_digest(key), pickle.dumps(records, pickle.HIGHEST_PROTOCOL), now)
+                                  for key, records in self._unsaved.items()])
+            self._db.execute('DELETE FROM subplans WHERE key NOT IN '
+                             '(SELECT key FROM subplans ORDER BY stored DESC LIMIT ?)', (self.maxsize,))
+        self._unsaved.clear()
+
+    def close(self):
+        """Flush the cache and close its database."""
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def clear(self):
+        """Forget the cached plans, including those in the database."""
+        self._entries.clear()
+        self._unsaved.clear()
+        if self._db is not None:
+            with self._db:
+                self._db.execute('DELETE FROM subplans')
+        self.hits = self.misses = self.stale = 0
+
+
+def _replay_records(state, records, in_place=False):
+    """
+    Apply the operators of tree records to a copy of state, or to state
+    itself if in_place; return the final state or False.
+    """
+    for goal, kind, name, _ in records:
+        if kind == 'operator':
+            operator = _declared(operators, goal, name)
+            if operator is None:
+                return False
+            state = _on(state if in_place else copy_state(state), operator, goal[1:])
+            if not state:
+                return False
+    return state
+
+
+def _records_plan(records):
+    return [(name,) + tuple(goal[1:]) for goal, kind, name, _ in records if kind == 'operator']
+
+
+def _digest(key):
+    """Return a digest of a cache key that is the same in every process."""
+    return hashlib.sha1(repr(_canonical(key)).encode('utf-8')).hexdigest()
+
+
+def _canonical(value):
+    """Return value with its sets and dicts replaced by sorted tuples, so that its repr is canonical."""
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_canonical(v) for v in value), key=repr))
+    if isinstance(value, dict):
+        return tuple(sorted(((_canonical(k), _canonical(v)) for k, v in value.items()), key=repr))
+    if isinstance(value, (tuple, list)):
+        return tuple(_canonical(v) for v in value)
+    return value
+
+
+############################################################
+# Parallel search
+def pyhop_parallel(state, goals, verbose=0, workers=None, prefer=None, split_depth=3, domains=None):
+    """
+    Like pyhop, but search the alternatives of the first choice points in
+    parallel on a pool of worker processes. The top of the search tree is
+    expanded (at most split_depth levels, until there is about one
+    subproblem per worker) and each resulting subproblem is searched in a
+    worker. prefer selects which plan is returned:
+    - None returns the first plan any worker finds;
+    - 'order' returns the plan pyhop itself would return, i.e. the plan of
+      the leftmost subproblem that has one (unless the domain depends on the
+      iteration order of sets, which may change when states are sent to
+      the workers);
+    - a function returns the plan that minimizes it, e.g. prefer=len.
+    As soon as the answer is known the remaining workers are cancelled.
+    domains lists the modules that declare the operators and methods; by
+    default they are the modules that define the declared functions.
+    """
+    if verbose > 0:
+        print('** hgn_pyhop_parallel, verbose={} **\n   state = {}\n   goals = {}'.format(verbose, state.__name__, goals))
+    workers = workers or multiprocessing.cpu_count()
+    subproblems = _split_search(state, goals, workers, split_depth)
+    if verbose > 1:
+        print('** {} subproblems for {} workers'.format(len(subproblems), workers))
+    result = False
+    solved = {}
+    context = multiprocessing.get_context()
+    cancel = context.Event()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(cancel, _domain_modules(domains)))
+    try:
+        pending = {}
+        for index, (substate, subgoals, prefix) in enumerate(subproblems):
+            if subgoals == []:
+                solved[index] = prefix
+            else:
+                pending[executor.submit(_solve_subproblem, substate, subgoals)] = (index, prefix)
+        while True:
+            result = _preferred_plan(solved, pending.values(), prefer)
+            if result is not None or not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, prefix = pending.pop(future)
+                plan = future.result()
+                if plan is not False:
+                    solved[index] = prefix + plan
+        if result is None:
+            result = False
+    finally:
+        cancel.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+    if verbose > 0:
+        print('** result =', result, '\n')
+    return result
+
+
+def _split_search(state, goals, workers, split_depth):
+    """
+    Expand the top of the search tree into a list of subproblems
+    (state, goals, plan prefix) in the order pyhop would search them.
+    """
+    frontier = [(_search_state(state), goals, [])]
+    for depth in range(split_depth):
+        if len(frontier) >= workers:
+            break
+        expanded = []
+        for substate, subgoals, prefix in frontier:
+            if subgoals == []:
+                expanded.append((substate, subgoals, prefix))
+                continue
+            for kind, newstate, newgoals, action, _ in relevant_choices(substate, subgoals[0], depth):
+                expanded.append((newstate, newgoals + subgoals[1:], prefix + [action] if action else prefix))
+        frontier = expanded
+    return frontier
+
+
+def _preferred_plan(solved, pending, prefer):
+    """
+    Return the plan to answer with once the plans in solved (a dict from
+    subproblem index to plan) are known and the subproblems in pending are
+    still running, or None if the answer depends on the pending ones.
+    """
+    if prefer is None:
+        return next(iter(solved.values()), None)
+    if prefer == 'order':
+        first_pending = min([index for (index, prefix) in pending] or [float('inf')])
+        first_solved = min(solved) if solved else None
+        if first_solved is not None and first_solved < first_pending:
+            return solved[first_solved]
+        return None
+    if pending or not solved:
+        return None
+    return min(solved.values(), key=prefer)
+
+
+def _domain_modules(domains):
+    """Return the names of the modules that declare the operators and methods."""
+    if domains is not None:
+        return list(domains)
+    modules = set()
+    for declarations in (operators, methods):
+        for functions in declarations.values():
+            modules.update(f.__module__ for f in functions)
+    modules.discard(None)
+    modules.discard('__main__')
+    modules.discard(__name__)
+    return sorted(modules)
+
+
+_cancelled = None
+_cancel_checks = 0
+
+
+def _init_worker(cancel, domains):
+    """Initializer of worker processes: import the domains and remember the cancel event."""
+    global _cancelled
+    _cancelled = cancel
+    for module in domains:
+        importlib.import_module(module)
+
+
+def _worker_stopped():
+    """Poll the cancel event of the pool, every 256 expansions to keep polling cheap."""
+    global _cancel_checks
+    _cancel_checks += 1
+    return _cancel_checks % 256 == 0 and _cancelled is not None and _cancelled.is_set()
+
+
+def _solve_subproblem(state, goals):
+    return pyhop(state, goals, engine='iterative', stop=_worker_stopped)
+
+
+############################################################
+# Batch planning
+class PlanningPool(object):
+    """
+    A persistent pool of worker processes for solving many problems of the
+    same domains. The domain modules are imported once in each worker when
+    the pool starts, so each problem only pays for its own search.
+    Close the pool with close(), or use it as a context manager.
+    """
+    def __init__(self, workers=None, domains=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        context = multiprocessing.get_context()
+        self._cancel = context.Event()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                             initargs=(self._cancel, _domain_modules(domains)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the workers, abandoning the searches that are still running."""
+        self._cancel.set()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def plan_batch(self, problems, timeout=None, **options):
+        """
+        Solve problems, an iterable of (state, goals) pairs, and yield
+        (index, result) pairs as the problems are solved, in completion
+        order; index is the position of the problem in problems and result
+        is what pyhop returns, which is a BudgetExhausted if the search took
+        more than timeout seconds. options are passed on to pyhop; a deadline
+        among them applies together with timeout, and a stop function
+        together with closing the pool. problems is consumed
+        lazily, a few problems per worker ahead of the results.
+        """
+        tasks = ((index, (state, goals, timeout, options)) for index, (state, goals) in enumerate(problems))
+        for result in self._map_unordered(_solve_problem, tasks):
+            yield result
+
+    def validate_batch(self, problems, chunksize=64):
+        """
+        Validate problems, an iterable of (state, plan, goals) triples, and
+        yield (index, ValidationResult) pairs as the plans are checked, in
+        completion order; see validate_plan. The problems are sent to the
+        workers chunksize at a time, since each check is short.
+        """
+        problems = enumerate(problems)
+        chunks = iter(lambda: list(itertools.islice(problems, chunksize)), [])
+        for _, results in self._map_unordered(_validate_chunk, ((None, (chunk,)) for chunk in chunks)):
+            for result in results:
+                yield result
+
+    def _map_unordered(self, function, tasks):
+        """
+        Call function(*args) on the workers for each (key, args) pair of
+        tasks and yield (key, result) pairs in completion order. tasks is
+        consumed lazily, a few tasks per worker ahead of the results.
+        """
+        pending = {}
+        try:
+            while True:
+                for key, args in itertools.islice(tasks, 2 * self.workers - len(pending)):
+                    pending[self._executor.submit(function, *args)] = key
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def plan_batch(problems, workers=None, timeout=None, domains=None, pool=None, **options):
+    """
+    Solve problems, an iterable of (state, goals) pairs, on a pool of
+    worker processes and yield (index, result) pairs as they complete; see
+    PlanningPool.plan_batch. Pass a PlanningPool as pool to keep its
+    workers across batches; otherwise a pool of workers processes is
+    started for this batch.
+    """
+    if pool is not None:
+        for result in pool.plan_batch(problems, timeout, **options):
+            yield result
+        return
+    with PlanningPool(workers, domains) as pool:
+        for result in pool.plan_batch(problems, timeout, **options):
+            yield result
+
+
+def _solve_problem(state, goals, timeout, options):
+    options = dict(options)
+    deadline = options.pop('deadline', None)
+    if timeout is not None:
+        deadline = time.time() + timeout if deadline is None else min(deadline, time.time() + timeout)
+    stop = options.pop('stop', None)
+    stopped = _worker_stopped if stop is None else (lambda: _worker_stopped() or stop())
+    return pyhop(state, goals, stop=stopped, deadline=deadline, **options)
+
+
+############################################################
+# Independent goals
+def pyhop_decomposed(state, goals, verbose=0, workers=None, domains=None, **options):
+    """
+    Like pyhop, but first split goals into clusters that do not interact
+    (see partition_goals), solve each cluster on its own and concatenate
+    their plans, in the order of the first goal of each cluster. The
+    search effort is then about the sum of that of the clusters instead of
+    compounding through backtracking across all the goals. With workers,
+    the goals are solved on a PlanningPool of that many processes (see
+    plan_batch for domains). options are passed on to pyhop. If the
+    analysis fails, for instance because some goal has no plan on its own,
+    or the goals all end up in one cluster, or the plans turn out to
+    interact after all, pyhop is called on all the goals instead.
+    The analysis solves every goal on its own first, so when pyhop does not
+    backtrack much across the goals anyway, as on the benchmark problems,
+    this costs a few times as much as pyhop.
+    """
+    if verbose > 0:
+        print('** hgn_pyhop decomposed, verbose={} **\n   state = {}\n   goals = {}'.format(verbose, state.__name__, goals))
+    state = freeze_static(state)  # Once for the analysis, the check and pyhop
+    pool = PlanningPool(workers, domains) if workers else None
+    try:
+        clusters, plans = _goal_clusters(state, goals, pool, options)
+    finally:
+        if pool is not None:
+            pool.close()
+    result = False
+    if clusters is not None:
+        if verbose > 1:
+            print('clusters: {}'.format([[goals[i] for i in cluster] for cluster in clusters]))
+        result = []
+        for cluster in clusters:
+            result.extend(plans[tuple(cluster)])
+        if not _plan_works(state, result, [(goals[i], plans[tuple(cluster)]) for cluster in clusters for i in cluster]):
+            result = False
+    if result is False:
+        if verbose > 1:
+            print('no independent clusters, solving all the goals together')
+        result = pyhop(state, goals, max(verbose - 1, 0), **options)
+    if verbose > 0:
+        print('** result =', result, '\n')
+    return result
+
+
+def partition_goals(state, goals, workers=None, domains=None, **options):
+    """
+    Partition goals into clusters of goals whose plans do not interact and
+    return them as lists of goals, in the order of their first goals.
+    Each goal is solved on its own with pyhop (options are passed on) and
+    the operators of its plan are replayed to record which state variable
+    bindings they read and write, together with the goal's own binding.
+    Goals end up in the same cluster when one of them writes a binding the
+    other reads or writes; clusters whose joint plans still interact are
+    merged. If some goal has no plan on its own, all goals are returned as
+    a single cluster, and so are they as soon as the clusters merge into one.
+    """
+    pool = PlanningPool(workers, domains) if workers else None
+    try:
+        clusters, _ = _goal_clusters(state, goals, pool, options)
+    finally:
+        if pool is not None:
+            pool.close()
+    if clusters is None:
+        return [list(goals)]
+    return [[goals[i] for i in cluster] for cluster in clusters]
+
+
+def _goal_clusters(state, goals, pool, options):
+    """
+    Return (clusters, plans): the clusters as sorted lists of goal indices
+    and a dict from tuple(cluster) to its plan, or (None, None) if the
+    goals do not split into several clusters.
+    """
+    if len(goals) < 2:
+        return None, None
+    state = freeze_static(state)  # Once for all the searches and replays below
+    clusters = [[i] for i in range(len(goals))]
+    plans = {}
+    while True:
+        unsolved = [cluster for cluster in clusters if tuple(cluster) not in plans]
+        results = _solve_all(state, [[goals[i] for i in cluster] for cluster in unsolved], pool, options)
+        for cluster, result in zip(unsolved, results):
+            if not isinstance(result, list):
+                return None, None
+            plans[tuple(cluster)] = result
+        footprints = [_footprint(state, plans[tuple(cluster)], [goals[i] for i in cluster]) for cluster in clusters]
+        groups = _interacting(footprints)
+        if len(groups) == 1:  # Solving them together is just pyhop
+            return None, None
+        if len(groups) == len(clusters):
+            return clusters, plans
+        clusters = [sorted(i for member in group for i in clusters[member]) for group in groups]
+        clusters.sort()
+
+
+def _solve_all(state, goal_lists, pool, options):
+    """Return pyhop's results for each list of goals, in order."""
+    if pool is None:
+        return [pyhop(state, goals, **options) for goals in goal_lists]
+    results = [None] * len(goal_lists)
+    for index, result in pool.plan_batch(((state, goals) for goals in goal_lists), **options):
+        results[index] = result
+    return results
+
+
+def _interacting(footprints):
+    """
+    Group the indices of footprints, (reads, writes) pairs, so that
+    footprints that interact end up in the same group; return the groups
+    as sorted lists, in order.
+    """
+    parent = list(range(len(footprints)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    writers = {}  # (variable, key) -> indices of the footprints that write it
+    variable_writers = {}  # variable -> indices of the footprints that write any of its keys
+    whole_writers = {}  # variable -> indices of the footprints that replace it as a whole
+    for i, (reads, writes) in enumerate(footprints):
+        for name, key in writes:
+            variable_writers.setdefault(name, []).append(i)
+            if key is None:
+                whole_writers.setdefault(name, []).append(i)
+            else:
+                writers.setdefault((name, key), []).append(i)
+    for same in itertools.chain(writers.values(), whole_writers.values()):  # Writers of a binding interact
+        for j in same[1:]:
+            parent[find(j)] = find(same[0])
+    wholes = {}  # variable -> a footprint that reads or writes all of it, joined to every writer of it
+    for i, (reads, writes) in enumerate(footprints):
+        for binding in itertools.chain(reads, writes):
+            name, key = binding
+            if key is None:
+                if name in wholes:
+                    others = (wholes[name],)
+                else:
+                    wholes[name] = i
+                    others = variable_writers.get(name, ())
+            else:
+                others = [same[0] for same in (writers.get(binding), whole_writers.get(name)) if same]
+            for j in others:
+                parent[find(j)] = find(i)
+    groups = OrderedDict()
+    for i in range(len(footprints)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _footprint(state, plan, goals):
+    """
+    Return the (variable, key) bindings the operators of plan read and
+    write when applied to state, and the bindings of goals as reads; key
+    None stands for the whole variable.
+    """
+    traced = _TracedState(state)
+    for goal in goals:
+        traced._reads.add((goal[0], goal[1]))
+    by_name = _operators_by_name()
+    for action in plan:
+        if not by_name[action[0]](traced, *action[1:]):
+            break
+    return traced._reads, traced._writes
+
+
+def _operators_by_name():
+    """Return a dict of operator name -> operator, cached until the next declaration."""
+    global _operator_names
+    if _operator_names[0] != _generation:
+        _operator_names = (_generation, dict((operator.__name__, operator)
+                                             for declared in operators.values() for operator in declared))
+    return _operator_names[1]
+
+
+_operator_names = (None, {})
+
+
+def _plan_works(state, plan, achieved):
+    """
+    Whether plan can be applied to state and leaves each goal in achieved,
+    a list of (goal, plan of its cluster) pairs, as the plan of its cluster
+    alone does.
+    """
+    by_name = _operators_by_name()
+    final = state
+    for action in plan:
+        final = _on(copy_state(final), by_name[action[0]], action[1:])
+        if not final:
+            return False
+    finals = {}
+    for goal, cluster_plan in achieved:
+        key = id(cluster_plan)
+        if key not in finals:
+            alone = state
+            for action in cluster_plan:
+                alone = _on(copy_state(alone), by_name[action[0]], action[1:])
+            finals[key] = alone
+        if _peek(final, goal[0]).get(goal[1]) != _peek(finals[key], goal[0]).get(goal[1]):
+            return False
+    return True
+
+
+class _TracedState(State):
+    """A copy of a state that records the (variable, key) bindings read and written through it."""
+    def __init__(self, state):
+        self.__dict__['__name__'] = state.__name__
+        self.__dict__['_shared'] = {}
+        self.__dict__['_reads'] = set()
+        self.__dict__['_writes'] = set()
+        for name, value in state_variables(state).items():
+            if not name.startswith('_'):
+                self.__dict__[name] = _traced(name, value, self._reads, self._writes)
+        if isinstance(state, State) and '_statics' in state.__dict__:  # Never written, so not traced
+            self.__dict__['_statics'] = state.__dict__['_statics']
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_'):
+            self._writes.add((name, None))
+            value = _traced(name, value, self._reads, self._writes)
+        self.__dict__[name] = value
+
+
+def _traced(name, value, reads, writes):
+    if isinstance(value, (dict, _VectorView)):
+        traced = _TracedDict(value.items())
+    elif isinstance(value, (set, frozenset)):
+        traced = _TracedSet(value)
+    else:
+        return value
+    traced._name = name
+    traced._reads = reads
+    traced._writes = writes
+    return traced
+
+
+class _TracedDict(dict):
+    __slots__ = ('_name', '_reads', '_writes')
+
+    def __getitem__(self, key):
+        self._reads.add((self._name, key))
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._reads.add((self._name, key))
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        self._reads.add((self._name, key))
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._reads.add((self._name, None))
+        return dict.__iter__(self)
+
+    def keys(self):
+        self._reads.add((self._name, None))
+        return dict.keys(self)
+
+    def values(self):
+        self._reads.add((self._name, None))
+        return dict.values(self)
+
+    def items(self):
+        self._reads.add((self._name, None))
+        return dict.items(self)
+
+    def __setitem__(self, key, value):
+        self._writes.add((self._name, key))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._writes.add((self._name, key))
+        dict.__delitem__(self, key)
+
+    def _changed(self):
+        self._writes.add((self._name, None))
+        return self
+
+    def update(self, *args, **kwargs):
+        return dict.update(self._changed(), *args, **kwargs)
+
+    def pop(self, *args):
+        return dict.pop(self._changed(), *args)
+
+    def popitem(self):
+        return dict.popitem(self._changed())
+
+    def setdefault(self, *args):
+        return dict.setdefault(self._changed(), *args)
+
+    def clear(self):
+        return dict.clear(self._changed())
+
+
+class _TracedSet(set):
+    __slots__ = ('_name', '_reads', '_writes')
+
+    def __contains__(self, item):
+        self._reads.add((self._name, item))
+        return set.__contains__(self, item)
+
+    def __iter__(self):
+        self._reads.add((self._name, None))
+        return set.__iter__(self)
+
+    def __len__(self):
+        self._reads.add((self._name, None))
+        return set.__len__(self)
+
+    def add(self, item):
+        self._writes.add((self._name, item))
+        set.add(self, item)
+
+    def discard(self, item):
+        self._writes.add((self._name, item))
+        set.discard(self, item)
+
+    def remove(self, item):
+        self._writes.add((self._name, item))
+        set.remove(self, item)
+
+    def _changed(self):
+        self._writes.add((self._name, None))
+        return self
+
+    def update(self, *others):
+        return set.update(self._changed(), *others)
+
+    def difference_update(self, *others):
+        return set.difference_update(self._changed(), *others)
+
+    def intersection_update(self, *others):
+        return set.intersection_update(self._changed(), *others)
+
+    def symmetric_difference_update(self, other):
+        return set.symmetric_difference_update(self._changed(), other)
+
+    def pop(self):
+        return set.pop(self._changed())
+
+    def clear(self):
+        return set.clear(self._changed())
+
+
+############################################################
+# Plan validation
+class ValidationResult(object):
+    """
+    What validate_plan returns. It is true in boolean context if the plan
+    is valid. Otherwise step is the index of the first action that could
+    not be applied, with action that action and reason 'unknown operator'
+    or 'not applicable', or, if every action applied, step is None, reason
+    is 'goals not achieved' and unachieved lists the goals that do not hold
+    at the end.
+    """
+    def __init__(self, valid, step=None, action=None, reason=None, unachieved=()):
+        self.valid = valid
+        self.step = step
+        self.action = action
+        self.reason = reason
+        self.unachieved = list(unachieved)
+
+    def __bool__(self):
+        return self.valid
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        if not isinstance(other, ValidationResult):
+            return NotImplemented
+        return ((self.valid, self.step, self.action, self.reason, self.unachieved) ==
+                (other.valid, other.step, other.action, other.reason, other.unachieved))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self.valid:
+            return '<ValidationResult valid>'
+        if self.step is not None:
+            return '<ValidationResult {} at step {}: {}>'.format(self.reason, self.step, self.action)
+        return '<ValidationResult {}: {}>'.format(self.reason, self.unachieved)
+
+
+def validate_plan(state, plan, goals=None, verbose=0):
+    """
+    Check that plan, a list of action tuples such as pyhop returns, can be
+    applied to state with the declared operators, and that every goal of
+    goals, if given, holds at the end. The actions are applied in place to
+    a single copy-on-write copy of state, so each variable is copied at
+    most once however long the plan is; state itself is not modified.
+    Return a ValidationResult that tells which step failed first, if any.
+    """
+    by_name = _operators_by_name()
+    current = copy_state(state)
+    for step, action in enumerate(plan):
+        operator = by_name.get(action[0])
+        if operator is None:
+            result = ValidationResult(False, step, action, 'unknown operator')
+            break
+        newstate = _on(current, operator, action[1:])
+        if not newstate:
+            result = ValidationResult(False, step, action, 'not applicable')
+            break
+        current = newstate
+    else:
+        unachieved = [goal for goal in goals or () if _peek(current, goal[0]).get(goal[1], _missing) != goal[2]]
+        result = ValidationResult(not unachieved, reason='goals not achieved' if unachieved else None,
+                                  unachieved=unachieved)
+    if verbose > 0:
+        print('** validate_plan: {} actions, result = {}'.format(len(plan), result))
+    return result
+
+
+def validate_plans(problems, workers=None, domains=None, pool=None, chunksize=64):
+    """
+    Validate problems, an iterable of (state, plan, goals) triples, on a
+    pool of worker processes and yield (index, ValidationResult) pairs as
+    they complete; see PlanningPool.validate_batch. Pass a PlanningPool as
+    pool to keep its workers across batches.
+    """
+    if pool is not None:
+        for result in pool.validate_batch(problems, chunksize):
+            yield result
+        return
+    with PlanningPool(workers, domains) as pool:
+        for result in pool.validate_batch(problems, chunksize):
+            yield result
+
+
+def _validate_chunk(chunk):
+    return [(index, validate_plan(state, plan, goals)) for index, (state, plan, goals) in chunk]
@@ -0,0 +1,111 @@
+"""
+Asyncio entry points for hgn_pyhop, for services that plan many requests
+on one event loop:
+
+- await pyhop_async(state1,tasklist,pause=100) runs the search on the
+  event loop itself, giving the other coroutines a turn after every pause
+  nodes.
+
+- await pyhop_in_executor(state1,tasklist) runs pyhop in a thread of an
+  executor, leaving the event loop free.
+
+- AsyncPlanner(max_concurrent=4) runs at most max_concurrent searches at a
+  time on each event loop, in either of the two ways; await
+  planner.plan(state1,tasklist,timeout=1.0) waits for a free slot and plans.
+
+All of them return what pyhop returns, a BudgetExhausted if a budget or
+timeout runs out. Cancelling the awaiting task, e.g. with asyncio.wait_for
+or asyncio.timeout, stops the search at its next node, also in a thread.
+"""
+
+import asyncio, weakref, functools, threading, time
+import hgn_pyhop
+
+
+async def pyhop_async(state, goals, verbose=0, pause=100, **options):
+    """
+    Plan like pyhop(...,engine='iterative') without blocking the event
+    loop: the search yields to the other coroutines after every pause
+    nodes. options are those of pyhop_steps (table, stop, max_nodes,
+    max_depth, deadline, stats, tracer, tree, cache, undo, cycles).
+    """
+    steps = hgn_pyhop.pyhop_steps(state, goals, verbose, pause, **options)
+    try:
+        for result in steps:
+            if result is None:
+                await asyncio.sleep(0)
+            else:
+                return result
+    finally:
+        steps.close()
+
+
+async def pyhop_in_executor(state, goals, verbose=0, executor=None, **options):
+    """
+    Run pyhop(state, goals, verbose, **options) in executor, a thread pool
+    (the event loop's default one if None). When the awaiting task is
+    cancelled, the search stops at its next node and the thread is freed.
+    """
+    cancelled = threading.Event()
+    stop = options.pop('stop', None)
+
+    def stopped():
+        return cancelled.is_set() or (stop is not None and stop())
+
+    loop = asyncio.get_running_loop()
+    search = functools.partial(hgn_pyhop.pyhop, state, goals, verbose, stop=stopped, **options)
+    try:
+        return await loop.run_in_executor(executor, search)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+class AsyncPlanner(object):
+    """
+    Plans requests concurrently on the running event loop, at most
+    max_concurrent at a time; the others wait for a slot in arrival order.
+    A planner may serve several event loops, one after the other as with
+    repeated asyncio.run calls or at once in different threads; each loop
+    has slots of its own.
+    With mode='cooperative' the searches share the event loop thread
+    (pyhop_async); with mode='thread' they run in executor
+    (pyhop_in_executor).
+    """
+    def __init__(self, max_concurrent=4, mode='cooperative', pause=100, executor=None):
+        if mode not in ('cooperative', 'thread'):
+            raise ValueError("mode must be 'cooperative' or 'thread', not {!r}".format(mode))
+        self.max_concurrent = max_concurrent
+        self.mode = mode
+        self.pause = pause
+        self.executor = executor
+        self.running = 0
+        self.waiting = 0
+        self._slots = weakref.WeakKeyDictionary()  # Event loop -> its semaphore
+
+    async def plan(self, state, goals, verbose=0, timeout=None, **options):
+        """
+        Wait for a free slot and plan. timeout, in seconds, counts from the
+        call and includes the wait; when it runs out the result is a
+        BudgetExhausted, as with pyhop's deadline. options are passed on.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+            options['deadline'] = deadline if options.get('deadline') is None else min(deadline, options['deadline'])
+        loop = asyncio.get_running_loop()
+        slots = self._slots.get(loop)
+        if slots is None:  # A semaphore belongs to the loop it is first used on
+            slots = self._slots[loop] = asyncio.Semaphore(self.max_concurrent)
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            if self.mode == 'cooperative':
+                return await pyhop_async(state, goals, verbose, self.pause, **options)
+            return await pyhop_in_executor(state, goals, verbose, self.executor, **options)
+        finally:
+            self.running -= 1
+            slots.release()
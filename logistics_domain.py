@@ -19,63 +19,62 @@ def find_plane(state, o):
 
 # Find an airport in the same city as the location
 def find_airport(state, l):
-    for a in state.airports:
-        if state.in_city[a] == state.in_city[l]:
+    for a in hgn_pyhop.static_index(state, 'in_city').get(state.in_city[l], ()):
+        if a in state.airports:
             return a
     return False
 
 
-# Operators
-def drive_truck(state, t, l):
-    if t in state.trucks and l in state.locations and state.in_city[state.at[t]] == state.in_city[l]:
-        state.at[t] = l
-        return state
-    return False
-
-
-def load_truck(state, o, t):
-    if o in state.packages and t in state.trucks and state.at[o] == state.at[t]:
-        state.at[o] = t
-        return state
-    return False
-
-
-def unload_truck(state, o, l):
-    if o in state.packages and state.at[o] in state.trucks and l in state.locations:
-        t = state.at[o]
-        if state.at[t] == l:
-            state.at[o] = l
-            return state
-    return False
-
-
-def fly_plane(state, plane, a):
-    if plane in state.airplanes and a in state.airports:
-        state.at[plane] = a
-        return state
-    return False
-
-
-def load_plane(state, o, plane):
-    if o in state.packages and plane in state.airplanes and state.at[o] == state.at[plane]:
-        state.at[o] = plane
-        return state
-    return False
+# Operators, as schemas: preconditions and effects are bindings over the parameters
+drive_truck = hgn_pyhop.operator_schema(
+    'drive_truck', ('t', 'l'),
+    [('trucks', 't'), ('locations', 'l'), ('in_city', ('at', 't'), ('in_city', 'l'))],
+    [('at', 't', 'l')],
+    module=__name__)
+
+load_truck = hgn_pyhop.operator_schema(
+    'load_truck', ('o', 't'),
+    [('packages', 'o'), ('trucks', 't'), ('at', 'o', ('at', 't'))],
+    [('at', 'o', 't')],
+    module=__name__)
+
+unload_truck = hgn_pyhop.operator_schema(
+    'unload_truck', ('o', 'l'),
+    [('packages', 'o'), ('trucks', ('at', 'o')), ('locations', 'l'), ('at', ('at', 'o'), 'l')],
+    [('at', 'o', 'l')],
+    module=__name__)
+
+fly_plane = hgn_pyhop.operator_schema(
+    'fly_plane', ('plane', 'a'),
+    [('airplanes', 'plane'), ('airports', 'a')],
+    [('at', 'plane', 'a')],
+    module=__name__)
+
+load_plane = hgn_pyhop.operator_schema(
+    'load_plane', ('o', 'plane'),
+    [('packages', 'o'), ('airplanes', 'plane'), ('at', 'o', ('at', 'plane'))],
+    [('at', 'o', 'plane')],
+    module=__name__)
+
+unload_plane = hgn_pyhop.operator_schema(
+    'unload_plane', ('o', 'a'),
+    [('packages', 'o'), ('airplanes', ('at', 'o')), ('airports', 'a'), ('at', ('at', 'o'), 'a')],
+    [('at', 'o', 'a')],
+    module=__name__)
 
 
-def unload_plane(state, o, a):
-    if o in state.packages and state.at[o] in state.airplanes and a in state.airports:
-        plane = state.at[o]
-        if state.at[plane] == a:
-            state.at[o] = a
-            return state
-    return False
+hgn_pyhop.declare_operators('at', drive_truck, load_truck, unload_truck, fly_plane, load_plane, unload_plane)
 
 
-hgn_pyhop.declare_operators('at', drive_truck, load_truck, unload_truck, fly_plane, load_plane, unload_plane)
+# Whether move_between_airports offers every plane, so that best-first and
+# anytime search can look for the plane that makes the cheapest plan; by
+# default it only uses find_plane's choice, which spares depth-first search
+# from trying every other plane before it backtracks further
+try_all_planes = False
 
 
 # Methods
+@hgn_pyhop.relevance('packages', 'locations')
 def move_within_city(state, o, l):
     if o in state.packages and state.at[o] in state.locations and state.in_city[state.at[o]] == state.in_city[l]:
         t = find_truck(state, o)
@@ -84,14 +83,21 @@ def move_within_city(state, o, l):
     return False
 
 
+@hgn_pyhop.relevance('packages', 'airports')
 def move_between_airports(state, o, a):
     if o in state.packages and state.at[o] in state.airports and a in state.airports and state.in_city[state.at[o]] != state.in_city[a]:
         plane = find_plane(state, o)
-        if plane:
+        if plane and not try_all_planes:
             return [('at', plane, state.at[o]), ('at', o, plane), ('at', plane, a), ('at', o, a)]
+        if plane:
+            # Any plane will do; find_plane's choice comes first
+            planes = [plane] + sorted(p for p in state.airplanes if p != plane)
+            return hgn_pyhop.Alternatives([('at', p, state.at[o]), ('at', o, p), ('at', p, a), ('at', o, a)]
+                                          for p in planes)
     return False
 
 
+@hgn_pyhop.relevance('packages', 'locations')
 def move_between_city(state, o, l):
     if o in state.packages and state.at[o] in state.locations and state.in_city[state.at[o]] != state.in_city[l]:
         a1 = find_airport(state, state.at[o])
@@ -102,3 +108,30 @@ def move_between_city(state, o, l):
 
 
 hgn_pyhop.declare_methods('at', move_within_city, move_between_airports, move_between_city)
+hgn_pyhop.declare_static('packages', 'trucks', 'airplanes', 'locations', 'airports', 'cities', 'in_city')
+
+
+# Heuristic for best-first search: estimate the actions needed to get o to l,
+# counting the loads and unloads of packages and one move for vehicles
+def at_estimate(state, o, l):
+    if state.at[o] == l:
+        return 0
+    if o not in state.packages or state.at[o] not in state.locations or l not in state.locations:
+        return 1
+    if state.in_city[state.at[o]] == state.in_city[l]:
+        return 2
+    return 4
+
+
+hgn_pyhop.declare_heuristic('at', at_estimate)
+
+
+# Projection for the subplan cache: a plan that moves package o depends on
+# where o and the vehicles are; plans that move a vehicle are single actions
+def at_projection(state, o, l):
+    if o not in state.packages:
+        return None
+    return state.at[o], tuple(sorted((v, state.at[v]) for v in state.trucks)), tuple(sorted((v, state.at[v]) for v in state.airplanes))
+
+
+hgn_pyhop.declare_projection('at', at_projection)
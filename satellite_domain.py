@@ -3,43 +3,39 @@ import hgn_pyhop
 
 # Find an instrument that supports mode m
 def find_instrument(state, m):
-    for i in state.instruments:
-        if m in state.supports[i]:
+    for i in hgn_pyhop.static_index(state, 'supports').get(m, ()):
+        if i in state.instruments:
             return i
     return False
 
 
-# Operators
-def turn_to(state, s, d):
-    if s in state.satellites and d in state.directions:
-        state.pointing[s] = d
-        return state
-    return False
-
+# Operators; those that only test and set bindings are schemas
+turn_to = hgn_pyhop.operator_schema(
+    'turn_to', ('s', 'd'),
+    [('satellites', 's'), ('directions', 'd')],
+    [('pointing', 's', 'd')],
+    module=__name__)
 
-def switch_on(state, i, val):
-    if i in state.instruments and state.power_avail[state.on_board[i]]:
-        state.power_on[i] = True
-        state.power_avail[state.on_board[i]] = False
-        return state
-    return False
+switch_on = hgn_pyhop.operator_schema(
+    'switch_on', ('i', 'val'),
+    [('instruments', 'i'), ('power_avail', ('on_board', 'i'), bool)],
+    [('power_on', 'i', True), ('power_avail', ('on_board', 'i'), False)],
+    module=__name__)
 
+switch_off = hgn_pyhop.operator_schema(
+    'switch_off', ('i', 'val'),
+    [('instruments', 'i'), ('power_on', 'i', bool)],
+    [('power_on', 'i', False), ('power_avail', ('on_board', 'i'), True)],
+    module=__name__)
 
-def switch_off(state, i, val):
-    if i in state.instruments and state.power_on[i]:
-        state.power_on[i] = False
-        state.power_avail[state.on_board[i]] = True
-        return state
-    return False
-
-
-def calibrate(state, i, val):
-    if i in state.instruments and state.power_on[i] and state.pointing[state.on_board[i]] == state.calibration_target[i]:
-        state.calibrated[i] = True
-        return state
-    return False
+calibrate = hgn_pyhop.operator_schema(
+    'calibrate', ('i', 'val'),
+    [('instruments', 'i'), ('power_on', 'i', bool), ('pointing', ('on_board', 'i'), ('calibration_target', 'i'))],
+    [('calibrated', 'i', True)],
+    module=__name__)
 
 
+@hgn_pyhop.relevance('directions', 'modes')
 def take_image(state, d, m):
     if d in state.directions and m in state.modes:
         i = find_instrument(state, m)
@@ -56,6 +52,7 @@ hgn_pyhop.declare_operators('have_image', take_image)
 
 
 # Methods
+@hgn_pyhop.relevance('directions', 'modes')
 def capture_image(state, d, m):
     if d in state.directions and m in state.modes:
         i = find_instrument(state, m)
@@ -64,12 +61,14 @@ def capture_image(state, d, m):
     return False
 
 
+@hgn_pyhop.relevance('instruments')
 def calibrate_instrument(state, i, val):
     if i in state.instruments and state.power_on[i] and not state.pointing[state.on_board[i]] == state.calibration_target[i]:
         return [('pointing', state.on_board[i], state.calibration_target[i]), ('calibrated', i, True)]
     return
 
 
+@hgn_pyhop.relevance('instruments')
 def activate(state, i, val):
     if i in state.instruments and not state.power_avail[state.on_board[i]]:
         for i0 in state.instruments:
@@ -81,3 +80,5 @@ def activate(state, i, val):
 hgn_pyhop.declare_methods('power_on', activate)
 hgn_pyhop.declare_methods('calibrated', calibrate_instrument)
 hgn_pyhop.declare_methods('have_image', capture_image)
+hgn_pyhop.declare_static('satellites', 'instruments', 'modes', 'directions', 'on_board', 'supports',
+                          'calibration_target')
@@ -0,0 +1,37 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hgn_pyhop
+import logistics_domain, satellite_domain  # Declared before the registries are saved below
+
+
+@pytest.fixture(autouse=True)
+def domains():
+    """Undo whatever a test declares, so that toy domains do not leak into other tests."""
+    saved = [(registry, dict(registry)) for registry in
+             (hgn_pyhop.operators, hgn_pyhop.methods, hgn_pyhop.heuristics, hgn_pyhop.projections)]
+    saved_statics = set(hgn_pyhop.statics)
+    yield
+    for registry, contents in saved:
+        registry.clear()
+        registry.update(contents)
+    hgn_pyhop.statics.clear()
+    hgn_pyhop.statics.update(saved_statics)
+    hgn_pyhop._generation += 1
+
+
+@pytest.fixture
+def logistics():
+    """A small logistics problem, as a (state, goals) pair."""
+    from benchmarks.generators import scaled_problem
+    return scaled_problem('logistics', 4, seed=1)
+
+
+@pytest.fixture
+def satellite():
+    """A small satellite problem, as a (state, goals) pair."""
+    from benchmarks.generators import scaled_problem
+    return scaled_problem('satellite', 4, seed=1)
@@ -0,0 +1,80 @@
+import asyncio, concurrent.futures, time
+
+import hgn_pyhop
+import hgn_pyhop_async
+from benchmarks.generators import scaled_problem
+
+
+def test_coroutines_give_the_plan_of_pyhop(logistics):
+    state, goals = logistics
+    plan = hgn_pyhop.pyhop(state, goals, engine='iterative')
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        results = (await hgn_pyhop_async.pyhop_async(state, goals, pause=1),
+                   await hgn_pyhop_async.pyhop_in_executor(state, goals))
+        task.cancel()
+        return results
+
+    assert asyncio.run(main()) == (plan, plan)
+    assert len(ticks) > 1
+
+
+def test_planners_run_at_most_max_concurrent_searches(logistics):
+    state, goals = logistics
+    plan = hgn_pyhop.pyhop(state, goals, engine='iterative')
+    planner = hgn_pyhop_async.AsyncPlanner(max_concurrent=2, pause=1)
+    seen = []
+
+    async def watch():
+        while True:
+            seen.append(planner.running)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(watch())
+        results = await asyncio.gather(*[planner.plan(state, goals) for _ in range(5)])
+        task.cancel()
+        return results
+
+    for _ in range(2):  # The planner outlives each loop
+        assert asyncio.run(main()) == [plan] * 5
+        assert max(seen) == 2 and planner.running == planner.waiting == 0
+
+
+def test_timeouts_give_budget_exhausted(logistics):
+    state, goals = logistics
+    for mode in ('cooperative', 'thread'):
+        planner = hgn_pyhop_async.AsyncPlanner(max_concurrent=1, mode=mode)
+        result = asyncio.run(planner.plan(state, goals, timeout=0))
+        assert isinstance(result, hgn_pyhop.BudgetExhausted) and result.reason == 'deadline'
+
+
+def test_cancelling_stops_the_search():
+    state, goals = scaled_problem('logistics', 300, seed=1)
+    for search in (hgn_pyhop_async.pyhop_async, hgn_pyhop_async.pyhop_in_executor):
+        stats = hgn_pyhop.SearchStats()
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+
+        async def main():
+            options = {'executor': executor} if search is hgn_pyhop_async.pyhop_in_executor else {}
+            task = asyncio.ensure_future(search(state, goals, stats=stats, **options))
+            while stats.nodes < 10:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+
+        assert asyncio.run(main())
+        executor.shutdown(wait=True)
+        nodes = stats.nodes
+        time.sleep(0.05)
+        assert stats.nodes == nodes < 1000
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import hgn_pyhop
+from hgn_pyhop import State, BudgetExhausted
+
+
+def declare_loop():
+    """A goal whose only method asks for the same goal again, forever."""
+    def again(state, obj, value):
+        return [('loop', obj, value)]
+
+    hgn_pyhop.declare_methods('loop', again)
+    state = State('s')
+    state.loop = {'x': 0}
+    return state, [('loop', 'x', 1)]
+
+
+@pytest.mark.parametrize('engine', ['recursive', 'iterative'])
+def test_max_nodes_ends_a_looping_search(engine):
+    state, goals = declare_loop()
+    stats = hgn_pyhop.SearchStats()
+    result = hgn_pyhop.pyhop(state, goals, engine=engine, max_nodes=5000, stats=stats)
+    assert isinstance(result, BudgetExhausted) and not result
+    assert result.reason == 'max_nodes'
+    assert stats.nodes == 5001
+
+
+@pytest.mark.parametrize('engine', ['recursive', 'iterative'])
+def test_deadline_ends_a_looping_search(engine):
+    state, goals = declare_loop()
+    result = hgn_pyhop.pyhop(state, goals, engine=engine, deadline=time.time() + 0.05)
+    assert isinstance(result, BudgetExhausted) and result.reason == 'deadline'
+
+
+@pytest.mark.parametrize('engine', ['recursive', 'iterative'])
+def test_max_depth_cuts_off_and_reports_it(engine):
+    state, goals = declare_loop()
+    result = hgn_pyhop.pyhop(state, goals, engine=engine, max_depth=50)
+    assert isinstance(result, BudgetExhausted) and result.reason == 'max_depth'
+    assert result.stats.cutoffs == 1
+
+
+def test_stop_abandons_the_search():
+    state, goals = declare_loop()
+    calls = []
+    assert hgn_pyhop.pyhop(state, goals, stop=lambda: calls.append(1) or len(calls) > 10) is False
+    assert len(calls) == 11
+
+
+def test_budgets_do_not_change_the_plan(logistics):
+    state, goals = logistics
+    plan = hgn_pyhop.pyhop(state, goals)
+    assert plan
+    for engine in ('recursive', 'iterative'):
+        assert hgn_pyhop.pyhop(state, goals, engine=engine, max_nodes=10 ** 6, max_depth=10 ** 6) == plan
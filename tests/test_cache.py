@@ -0,0 +1,55 @@
+import json, os, subprocess, sys
+
+import hgn_pyhop
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Plans a satellite problem with a SubplanCache kept in the database sys.argv[1]
+PLAN = '''
+import json, sys
+sys.path.insert(0, {root!r})
+import hgn_pyhop, satellite_domain
+from benchmarks.generators import scaled_problem
+state, goals = scaled_problem('satellite', 8, seed=3)
+stats = hgn_pyhop.SearchStats()
+with hgn_pyhop.SubplanCache(path=sys.argv[1]) as cache:
+    plan = hgn_pyhop.pyhop(state, goals, cache=cache, stats=stats)
+key = hgn_pyhop._digest(hgn_pyhop.state_key(hgn_pyhop.freeze_static(state)))
+print(json.dumps({{'plan': plan, 'hits': cache.hits, 'nodes': stats.nodes, 'key': key}}))
+'''
+
+
+def plan_in_process(path, seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    output = subprocess.check_output([sys.executable, '-c', PLAN.format(root=ROOT), str(path)], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def test_cached_plans_are_found_by_processes_with_other_hash_seeds(tmp_path):
+    path = tmp_path / 'plans.db'
+    cold = plan_in_process(path, 1)
+    warm = plan_in_process(path, 2)
+    assert cold['key'] == warm['key']
+    assert cold['hits'] == 0
+    assert warm['hits'] > 0 and warm['nodes'] < cold['nodes']
+    assert warm['plan'] == cold['plan']
+
+
+def test_cached_plans_are_replayed_before_use(satellite):
+    state, goals = satellite
+    cache = hgn_pyhop.SubplanCache()
+    plan = hgn_pyhop.pyhop(state, goals, cache=cache)
+    assert len(cache) > 0
+    assert hgn_pyhop.pyhop(state, goals, cache=cache) == plan
+    assert cache.hits > 0 and cache.stale == 0
+
+
+def test_static_index_is_kept_for_compact_states(satellite):
+    compact = hgn_pyhop.compile_state(satellite[0])
+    index = hgn_pyhop.static_index(compact, 'on_board')
+    assert hgn_pyhop.static_index(compact.copy(), 'on_board') is index
+    assert index == hgn_pyhop.static_index(satellite[0], 'on_board')
+    changed = compact.copy()
+    instrument = next(iter(changed.on_board))
+    changed.on_board[instrument] = 'elsewhere'
+    assert hgn_pyhop.static_index(changed, 'on_board')['elsewhere'] == (instrument,)
@@ -0,0 +1,51 @@
+import gc, pickle, weakref
+
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+def test_compact_states_plan_like_states(logistics, satellite):
+    for state, goals in (logistics, satellite):
+        compact = hgn_pyhop.compile_state(state)
+        plan = hgn_pyhop.pyhop(state, goals)
+        assert hgn_pyhop.pyhop(compact, goals) == plan
+        assert hgn_pyhop.validate_plan(compact, plan, goals)
+
+
+def test_copies_compare_and_hash_by_their_vectors(logistics):
+    compact = hgn_pyhop.compile_state(logistics[0])
+    child = compact.copy()
+    assert child == compact and hash(child) == hash(compact)
+    obj = next(iter(child.at))
+    child.at[obj] = 'nowhere'
+    assert child != compact
+    assert compact.at[obj] != 'nowhere'
+
+
+def test_equal_states_hash_equal_across_layouts(logistics):
+    state = logistics[0]
+    reordered = state.copy()
+    reordered.at = dict(reversed(list(state.at.items())))  # Interned in another order
+    first = hgn_pyhop.compile_state(state)
+    restored = pickle.loads(pickle.dumps(first))
+    for other in (hgn_pyhop.compile_state(state), hgn_pyhop.compile_state(reordered), restored):
+        assert other != first or hash(other) == hash(first)
+        assert other.to_state() == first.to_state()
+
+
+def test_table_keys_of_compact_states_keep_their_layout():
+    table = hgn_pyhop.TranspositionTable()
+    goals = [('at', 'x', 'there')]
+    first = State('s')
+    first.at = {'x': 'here'}
+    compact = hgn_pyhop.compile_state(first)
+    layout = weakref.ref(compact._layout)
+    table.record_failure(table.key(compact, goals))
+    del compact
+    gc.collect()
+    assert layout() is not None  # Otherwise the id of the layout could be reused by another one
+    other = State('s')
+    other.at = {'x': 'elsewhere'}
+    compact = hgn_pyhop.compile_state(other)  # Same vector bytes, other bindings
+    assert hash(compact) == hash(hgn_pyhop.compile_state(first))
+    assert not table.failed(table.key(compact, goals))
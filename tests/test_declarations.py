@@ -0,0 +1,35 @@
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+def declare_paint():
+    @hgn_pyhop.relevance('paintable')
+    def paint(state, obj, colour):
+        state.colour[obj] = colour
+        return state
+
+    hgn_pyhop.declare_operators('colour', paint)
+
+
+def test_relevance_is_not_cached_on_the_callers_state():
+    declare_paint()
+    state = State('s')
+    state.paintable = {'door'}
+    state.colour = {'door': 'white', 'wall': 'white'}
+    assert hgn_pyhop.pyhop(state, [('colour', 'wall', 'red')]) is False
+    assert '_relevant' not in vars(state)
+    state.paintable = {'door', 'wall'}
+    assert hgn_pyhop.pyhop(state, [('colour', 'wall', 'red')]) == [('paint', 'wall', 'red')]
+    compact = hgn_pyhop.compile_state(state)
+    assert hgn_pyhop.pyhop(compact, [('colour', 'wall', 'red')]) == [('paint', 'wall', 'red')]
+    assert compact._relevant is None
+
+
+def test_relevant_declarations_follow_the_guards():
+    declare_paint()
+    state = State('s')
+    state.paintable = {'door'}
+    state.colour = {'door': 'white'}
+    operators, methods = hgn_pyhop.relevant_declarations(state, ('colour', 'door', 'red'))
+    assert [f.__name__ for f in operators] == ['paint'] and methods == ()
+    assert hgn_pyhop.relevant_declarations(state, ('colour', 'wall', 'red')) == ((), ())
@@ -0,0 +1,48 @@
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+def declare_lamps(fuses, spare):
+    """Each lamp that is switched on uses up a spare slot of its fuse."""
+    def switch(state, lamp, value):
+        fuse = state.fuse[lamp]
+        if value and state.spare[fuse] > 0:
+            state.spare[fuse] -= 1
+            state.lit[lamp] = True
+            return state
+        return False
+
+    hgn_pyhop.declare_operators('lit', switch)
+    state = State('s')
+    state.lit = dict((lamp, False) for lamp, _ in fuses)
+    state.fuse = dict(fuses)
+    state.spare = dict(spare)
+    return state, [('lit', lamp, True) for lamp, _ in fuses]
+
+
+def test_goals_sharing_bindings_are_clustered_in_goal_order():
+    state, goals = declare_lamps([('a', 1), ('b', 2), ('c', 1)], {1: 2, 2: 1})
+    assert hgn_pyhop.partition_goals(state, goals) == [[goals[0], goals[2]], [goals[1]]]
+    plan = hgn_pyhop.pyhop_decomposed(state, goals)
+    assert plan == [('switch', 'a', True), ('switch', 'c', True), ('switch', 'b', True)]
+    assert hgn_pyhop.validate_plan(state, plan, goals)
+
+
+def test_clusters_without_a_joint_plan_fall_back_to_pyhop():
+    state, goals = declare_lamps([('a', 1), ('b', 2), ('c', 1)], {1: 1, 2: 1})
+    assert hgn_pyhop.partition_goals(state, goals) == [goals]
+    assert hgn_pyhop.pyhop_decomposed(state, goals) is False
+
+
+def test_goals_in_one_cluster_are_solved_by_pyhop():
+    state, goals = declare_lamps([('a', 1), ('b', 1)], {1: 2})
+    assert hgn_pyhop.partition_goals(state, goals) == [goals]
+    assert hgn_pyhop.pyhop_decomposed(state, goals) == hgn_pyhop.pyhop(state, goals)
+
+
+def test_decomposed_plans_are_valid(logistics, satellite):
+    for state, goals in (logistics, satellite):
+        clusters = hgn_pyhop.partition_goals(state, goals, engine='iterative')
+        assert sorted(goal for cluster in clusters for goal in cluster) == sorted(goals)
+        plan = hgn_pyhop.pyhop_decomposed(state, goals, engine='iterative')
+        assert plan and hgn_pyhop.validate_plan(state, plan, goals)
@@ -0,0 +1,121 @@
+import itertools
+
+import pytest
+
+import hgn_pyhop
+import logistics_domain
+from benchmarks.generators import scaled_problem
+
+
+@pytest.mark.parametrize('domain, size', [('logistics', 8), ('logistics', 20), ('satellite', 20)])
+def test_best_first_finishes_with_the_default_weight(domain, size):
+    state, goals = scaled_problem(domain, size, seed=1)
+    plan = hgn_pyhop.pyhop(state, goals, engine='best-first', max_nodes=50000)
+    assert plan
+    assert hgn_pyhop.validate_plan(state, plan, goals)
+    assert len(plan) <= len(hgn_pyhop.pyhop(state, goals))
+
+
+def test_offering_every_plane_is_opt_in(monkeypatch):
+    state, goals = scaled_problem('logistics', 8, seed=3)
+    plan = hgn_pyhop.pyhop(state, goals)
+    best = hgn_pyhop.pyhop(state, goals, engine='best-first')
+    monkeypatch.setattr(logistics_domain, 'try_all_planes', True)
+    assert hgn_pyhop.pyhop(state, goals) == plan  # find_plane's choice still comes first
+    choosier = hgn_pyhop.pyhop(state, goals, engine='best-first')
+    assert hgn_pyhop.validate_plan(state, choosier, goals) and len(choosier) <= len(best)
+
+
+def test_best_first_plain_a_star_finds_a_plan_no_worse(logistics):
+    state, goals = logistics
+    a_star = hgn_pyhop.pyhop(state, goals, engine='best-first', weight=1)
+    assert hgn_pyhop.validate_plan(state, a_star, goals)
+    assert len(a_star) <= len(hgn_pyhop.pyhop(state, goals, engine='best-first'))
+
+
+def test_best_first_takes_no_table(logistics):
+    with pytest.raises(ValueError):
+        hgn_pyhop.pyhop(logistics[0], logistics[1], engine='best-first', table=hgn_pyhop.TranspositionTable())
+
+
+def test_depth_first_engines_find_the_same_plan(logistics, satellite):
+    for state, goals in (logistics, satellite):
+        plan = hgn_pyhop.pyhop(state, goals)
+        assert plan and hgn_pyhop.validate_plan(state, plan, goals)
+        for options in ({'engine': 'iterative'}, {'undo': True}, {'cycles': 'prune'},
+                        {'table': hgn_pyhop.TranspositionTable()}, {'engine': 'iterative', 'max_nodes': 10 ** 6}):
+            assert hgn_pyhop.pyhop(state, goals, **options) == plan, options
+        assert hgn_pyhop.tree_plan(hgn_pyhop.pyhop(state, goals, tree=True)) == plan
+        assert next(hgn_pyhop.iter_plans(state, goals)) == plan
+        assert next(hgn_pyhop.pyhop_anytime(state, goals)) == plan
+        assert list(hgn_pyhop.pyhop_steps(state, goals, pause=10))[-1] == plan
+
+
+def test_anytime_search_takes_the_options_of_pyhop(logistics):
+    state, goals = logistics
+    best = list(hgn_pyhop.pyhop_anytime(state, goals, undo=True, max_nodes=20000))
+    assert best[0] == hgn_pyhop.pyhop(state, goals) and hgn_pyhop.validate_plan(state, best[-1], goals)
+
+
+def test_iter_plans_takes_the_options_of_pyhop(logistics):
+    state, goals = logistics
+    plans = list(itertools.islice(hgn_pyhop.iter_plans(state, goals), 5))
+    for options in ({'undo': True}, {'cache': hgn_pyhop.SubplanCache()}):
+        assert list(itertools.islice(hgn_pyhop.iter_plans(state, goals, **options), 5)) == plans, options
+    stats = hgn_pyhop.SearchStats()
+    pruned = list(itertools.islice(hgn_pyhop.iter_plans(state, goals, cycles='prune', stats=stats), 5))
+    assert pruned[0] == plans[0] and stats.cycles > 0  # Later plans that go round a loop are pruned
+    trees = list(itertools.islice(hgn_pyhop.iter_plans(state, goals, tree=True), 5))
+    assert [hgn_pyhop.tree_plan(tree) for tree in trees] == plans
+
+
+def test_pyhop_steps_takes_the_options_of_pyhop(logistics):
+    state, goals = logistics
+    steps = list(hgn_pyhop.pyhop_steps(state, goals, pause=5, undo=True, tree=True))
+    assert steps[:-1] == [None] * (len(steps) - 1)
+    assert hgn_pyhop.tree_plan(steps[-1]) == hgn_pyhop.pyhop(state, goals)
+
+
+@pytest.mark.parametrize('domain, size', [('logistics', 4), ('logistics', 6), ('satellite', 6)])
+def test_anytime_search_ends_despite_method_loops(domain, size):
+    state, goals = scaled_problem(domain, size, seed=1)
+    stats = hgn_pyhop.SearchStats()
+    plans = list(hgn_pyhop.pyhop_anytime(state, goals, max_nodes=200000, stats=stats))
+    assert stats.nodes < 200000
+    assert plans[0] == hgn_pyhop.pyhop(state, goals)
+    assert [len(plan) for plan in plans] == sorted(set(len(plan) for plan in plans), reverse=True)
+    assert len(plans[-1]) <= len(hgn_pyhop.pyhop(state, goals, engine='best-first', weight=1))
+    assert hgn_pyhop.pyhop(state, goals, engine='anytime', max_nodes=200000) == plans[-1]
+
+
+@pytest.mark.parametrize('options', [{}, {'undo': True}, {'engine': 'iterative'}])
+def test_cycle_pruning_compares_states_whose_hashes_collide(logistics, monkeypatch, options):
+    state, goals = logistics
+    plan = hgn_pyhop.pyhop(state, goals)
+    monkeypatch.setattr(hgn_pyhop.State, '__hash__', lambda self: 0)
+    stats = hgn_pyhop.SearchStats()
+    assert hgn_pyhop.pyhop(state, goals, cycles='prune', stats=stats, **options) == plan
+    assert stats.cycles == 0
+
+
+def test_cycles_are_found_in_states_changed_in_place(logistics):
+    state, goals = logistics
+    found = []
+    for undo in (False, True):
+        stats = hgn_pyhop.SearchStats()
+        plans = list(itertools.islice(hgn_pyhop.iter_plans(state, goals, cycles='prune', stats=stats, undo=undo), 5))
+        found.append((plans, stats.cycles))
+    assert found[0] == found[1] and found[0][1] > 0
+
+
+def test_anytime_search_prunes_cycles_unless_told_otherwise(logistics):
+    state, goals = logistics
+    counts = []
+    for options in ({}, {'cycles': None}):
+        stats = hgn_pyhop.SearchStats()
+        hgn_pyhop.pyhop(state, goals, engine='anytime', max_nodes=20000, stats=stats, **options)
+        other = hgn_pyhop.SearchStats()
+        list(hgn_pyhop.pyhop_anytime(state, goals, max_nodes=20000, stats=other, **options))
+        assert stats.nodes == other.nodes
+        counts.append(stats.cycles)
+    assert counts[0] > 0 and counts[1] == 0
@@ -0,0 +1,98 @@
+import functools, time
+
+import pytest
+
+import hgn_pyhop
+from benchmarks.generators import scaled_problem
+
+DOMAINS = ['logistics_domain', 'satellite_domain']
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with hgn_pyhop.PlanningPool(2, DOMAINS) as pool:
+        yield pool
+
+
+def problems():
+    return [scaled_problem(domain, size, seed=seed) for domain in ('logistics', 'satellite')
+            for size in (3, 6) for seed in (1, 2)]
+
+
+def test_batches_give_the_plans_of_pyhop(pool):
+    batch = problems()
+    expected = [hgn_pyhop.pyhop(state, goals, engine='iterative') for state, goals in batch]
+    assert dict(pool.plan_batch(batch)) == dict(enumerate(expected))
+    assert dict(pool.plan_batch(iter(batch[:3]), engine='iterative')) == dict(enumerate(expected[:3]))
+    assert dict(hgn_pyhop.plan_batch(batch[:2], workers=2, domains=DOMAINS)) == dict(enumerate(expected[:2]))
+
+
+def test_batches_report_problems_without_a_plan(pool):
+    state, goals = scaled_problem('logistics', 3, seed=1)
+    package = sorted(state.packages)[0]
+    results = dict(pool.plan_batch([(state, goals), (state, [('at', package, 'nowhere')])]))
+    assert results[0] and results[1] is False
+
+
+def test_batches_take_a_deadline_and_a_stop_function_of_their_own(pool):
+    batch = problems()[:2]
+    results = dict(pool.plan_batch(batch, timeout=60, deadline=time.time() - 1))
+    assert all(isinstance(result, hgn_pyhop.BudgetExhausted) for result in results.values())
+    assert dict(pool.plan_batch(batch, stop=functools.partial(bool, True))) == {0: False, 1: False}
+    assert all(dict(pool.plan_batch(batch, timeout=60, deadline=time.time() + 60, stop=bool)).values())
+
+
+def test_bulk_validation_agrees_with_validate_plan(pool):
+    triples = []
+    for state, goals in problems():
+        plan = hgn_pyhop.pyhop(state, goals)
+        triples += [(state, plan, goals), (state, plan[:-1], goals), (state, [('teleport', 'x')] + plan, goals),
+                    (state, plan[1:], goals)]
+    serial = [hgn_pyhop.validate_plan(*triple) for triple in triples]
+    assert sum(1 for result in serial if result) == len(triples) // 4
+    assert dict(pool.validate_batch(triples, chunksize=3)) == dict(enumerate(serial))
+    assert dict(hgn_pyhop.validate_plans(triples[:5], pool=pool)) == dict(enumerate(serial[:5]))
+
+
+def test_parallel_search_in_order_finds_the_plan_of_pyhop(logistics):
+    state, goals = logistics
+    plan = hgn_pyhop.pyhop(state, goals)
+    assert hgn_pyhop.pyhop_parallel(state, goals, workers=2, prefer='order', domains=DOMAINS) == plan
+
+
+def declare_late_success():
+    """Of the three ways to town, only the last one leads there."""
+    def step(state, obj, place):
+        if place in state.links[state.at[obj]]:
+            state.at[obj] = place
+            return state
+        return False
+
+    def via(middle):
+        def method(state, obj, place):
+            if state.at[obj] == 'home' and place not in state.links['home']:
+                return [('at', obj, middle), ('at', obj, place)]
+            return False
+        method.__name__ = 'via_' + middle
+        return method
+
+    hgn_pyhop.declare_operators('at', step)
+    hgn_pyhop.declare_methods('at', via('pit'), via('moat'), via('road'))
+    state = hgn_pyhop.State('s')
+    state.at = {'x': 'home'}
+    state.links = {'home': ('pit', 'moat', 'road'), 'pit': (), 'moat': (), 'road': ('town',)}
+    return state, [('at', 'x', 'town')]
+
+
+@pytest.mark.parametrize('prefer', [None, 'order', len])
+def test_parallel_search_finds_a_plan_only_a_later_subproblem_has(prefer):
+    state, goals = declare_late_success()
+    plan = hgn_pyhop.pyhop(state, goals)
+    assert plan == [('step', 'x', 'road'), ('step', 'x', 'town')]
+    assert hgn_pyhop.pyhop_parallel(state, goals, workers=2, prefer=prefer, split_depth=1, domains=[]) == plan
+
+
+def test_parallel_search_leaves_the_callers_state_alone(logistics):
+    state, goals = logistics
+    hgn_pyhop.pyhop_parallel(state, goals, workers=2, prefer='order', split_depth=1, domains=DOMAINS)
+    assert '_relevant' not in vars(state)
@@ -0,0 +1,40 @@
+import hgn_pyhop
+
+
+def execute(state, plan):
+    by_name = dict((operator.__name__, operator) for declared in hgn_pyhop.operators.values() for operator in declared)
+    for action in plan:
+        state = by_name[action[0]](hgn_pyhop.copy_state(state), *action[1:])
+        assert state, action
+    return state
+
+
+def test_an_unchanged_world_keeps_the_tree_without_search(logistics, satellite):
+    for state, goals in (logistics, satellite):
+        tree = hgn_pyhop.pyhop(state, goals, tree=True)
+        plan = hgn_pyhop.tree_plan(tree)
+        stats = hgn_pyhop.SearchStats()
+        assert hgn_pyhop.replan(state, tree, stats=stats) == tree
+        assert stats.nodes == 0
+        for executed in (1, len(plan) // 2, len(plan)):
+            current = execute(state, plan[:executed])
+            assert hgn_pyhop.tree_plan(hgn_pyhop.replan(current, tree, executed=executed)) == plan[executed:]
+
+
+def test_a_moved_truck_is_planned_around(logistics):
+    state, goals = logistics
+    tree = hgn_pyhop.pyhop(state, goals, tree=True)
+    plan = hgn_pyhop.tree_plan(tree)
+    executed = len(plan) // 2
+    current = execute(state, plan[:executed])
+    truck = sorted(state.trucks)[0]
+    city = state.in_city[current.at[truck]]
+    place = next(location for location in sorted(state.locations)
+                 if state.in_city[location] == city and location != current.at[truck])
+    repaired = hgn_pyhop.replan(current, tree, {'at': {truck: place}}, executed=executed)
+    assert repaired
+    changed = hgn_pyhop.copy_state(current)
+    changed.at[truck] = place
+    final = execute(changed, hgn_pyhop.tree_plan(repaired))
+    assert all(getattr(final, variable)[obj] == value for variable, obj, value in goals)
+    assert current.at[truck] != place
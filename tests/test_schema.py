@@ -0,0 +1,44 @@
+import pytest
+
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+def declare_switch():
+    switch_on = hgn_pyhop.operator_schema(
+        'switch_on', ('i', 'val'),
+        [('instruments', 'i'), ('power_avail', ('on_board', 'i'), bool)],
+        [('power_on', 'i', True), ('power_avail', ('on_board', 'i'), False)],
+        module=__name__)
+    hgn_pyhop.declare_operators('power_on', switch_on)
+    return switch_on
+
+
+def test_truth_preconditions_accept_any_true_value():
+    switch_on = declare_switch()
+    state = State('s')
+    state.instruments = {'camera'}
+    state.on_board = {'camera': 'sat'}
+    state.power_on = {'camera': False}
+    for available, applicable in (('battery', True), (2, True), ('', False), (None, False)):
+        state.power_avail = {'sat': available}
+        assert bool(switch_on.applicable(state, 'camera', True)) is applicable, available
+    state.power_avail = {'sat': ['battery']}
+    assert hgn_pyhop.pyhop(state, [('power_on', 'camera', True)]) == [('switch_on', 'camera', True)]
+
+
+def test_schemas_belong_to_the_module_given():
+    assert declare_switch().__module__ == __name__
+    assert __name__ in hgn_pyhop._domain_modules(None)
+    anonymous = hgn_pyhop.operator_schema('paint', ('o',), [], [('colour', 'o', 'red')])
+    hgn_pyhop.declare_operators('colour', anonymous)
+    assert None not in hgn_pyhop._domain_modules(None)
+
+
+def test_malformed_schemas_are_rejected():
+    with pytest.raises(ValueError):
+        hgn_pyhop.operator_schema('paint', ('o',), [('colour',)], [('colour', 'o', 'red')])
+    with pytest.raises(ValueError):
+        hgn_pyhop.operator_schema('paint', ('o', 'o'), [], [('colour', 'o', 'red')])
+    with pytest.raises(ValueError):
+        hgn_pyhop.operator_schema('paint', ('o',), [], [])
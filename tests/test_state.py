@@ -0,0 +1,150 @@
+import json, pickle, threading
+
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+def make_state():
+    state = State('s')
+    state.fuel = 3
+    state.busy = False
+    state.ts = {'a', 'b'}
+    state.at = {'r': 'x', 'p': 'y'}
+    state.holding = {'r': ['box']}
+    state.stack = [1, 2]
+    return state
+
+
+def test_scalars_read_as_plain_values():
+    child = make_state().copy()
+    assert child.fuel + 1 == 4
+    assert child.fuel > 2
+    assert not child.busy
+    assert type(child.fuel) is int
+    child.fuel += 1
+    assert child.fuel == 4
+
+
+def test_sets_and_dicts_behave_like_sets_and_dicts():
+    child = make_state().copy()
+    assert child.ts | {'c'} == {'a', 'b', 'c'}
+    assert child.ts - {'a'} == {'b'}
+    assert set(child.ts) == {'a', 'b'}
+    assert isinstance(child.ts, set)
+    assert isinstance(child.at, dict)
+    assert json.loads(json.dumps(child.at)) == {'r': 'x', 'p': 'y'}
+
+
+def test_writes_are_not_seen_by_the_other_copy():
+    parent = make_state()
+    child = parent.copy()
+    child.fuel += 1
+    child.ts.add('c')
+    child.at['r'] = 'z'
+    child.stack.append(3)
+    assert parent.fuel == 3
+    assert parent.ts == {'a', 'b'}
+    assert parent.at['r'] == 'x'
+    assert parent.stack == [1, 2]
+    parent.at['p'] = 'q'
+    assert child.at['p'] == 'y'
+
+
+def test_nested_values_are_not_shared():
+    parent = make_state()
+    child = parent.copy()
+    child.holding['r'].append('ball')
+    assert parent.holding == {'r': ['box']}
+    other = parent.copy()
+    other.at['r'] = 'w'  # Owning the variable for another reason copies nested values too
+    other.holding['q'] = []
+    other.holding['r'].append('cup')
+    assert parent.holding == {'r': ['box']}
+    assert child.holding == {'r': ['box', 'ball']}
+
+
+def test_toy_domain_with_a_boolean_variable():
+    def grab(state, r, item):
+        if not state.busy:
+            state.busy = True
+            state.holding[r].append(item)
+            return state
+        return False
+
+    hgn_pyhop.declare_operators('holding', grab)
+    state = make_state()
+    assert hgn_pyhop.pyhop(state, [('holding', 'r', 'x')]) == [('grab', 'r', 'x')]
+    assert hgn_pyhop.pyhop(state, [('holding', 'r', 'x')], engine='iterative') == [('grab', 'r', 'x')]
+    assert state.holding == {'r': ['box']}
+    assert state.busy is False
+
+
+def test_copies_pickle_and_compare_equal():
+    parent = make_state()
+    child = parent.copy()
+    assert child == parent and hash(child) == hash(parent)
+    clone = pickle.loads(pickle.dumps(child))
+    assert clone == child and hash(clone) == hash(child)
+    child.at['r'] = 'z'
+    assert child != parent
+
+
+def test_hashes_follow_the_bindings_not_the_history():
+    state = make_state()
+    child = state.copy()
+    child.at['r'] = 'z'
+    child.ts.discard('a')
+    assert child != state and hash(child) != hash(state)
+    child.at['r'] = 'x'
+    child.ts.add('a')
+    assert child == state and hash(child) == hash(state)
+    rebuilt = make_state()
+    rebuilt.at = {'p': 'y', 'r': 'x'}
+    assert rebuilt == state and hash(rebuilt) == hash(state)
+
+
+def test_hashes_survive_copies_and_pickles_of_changed_states(logistics):
+    state = hgn_pyhop.freeze_static(logistics[0])
+    states = [state]
+    for i in range(50):
+        child = states[i // 3].copy()
+        obj = sorted(child.at)[i % len(child.at)]
+        child.at[obj] = 'elsewhere{}'.format(i % 2)
+        states.append(child)
+    for other in states:
+        restored = pickle.loads(pickle.dumps(other))
+        assert restored == other and hash(restored) == hash(other)
+
+
+def test_domain_code_reads_shared_variables_without_copying():
+    parent = make_state()
+    first, second = parent.copy(), parent.copy()
+
+    def look(state):
+        return state.at['r'], state.ts
+
+    def move(state):
+        at = state.at
+        at['r'] = 'z'
+        at['p'] = 'w'
+        return state.at is at
+
+    assert hgn_pyhop._on(first, look, ())[0] == 'x'
+    assert 'at' not in vars(first) and 'ts' not in vars(first)
+    assert hgn_pyhop._on(first, move, ())
+    assert first.at == {'r': 'z', 'p': 'w'}
+    assert parent.at == {'r': 'x', 'p': 'y'} and second.at == {'r': 'x', 'p': 'y'}
+    assert hash(first) != hash(second) and hash(parent) == hash(second)
+    assert hgn_pyhop._on(first, lambda state: state.holding is parent.holding, ()) is False
+
+
+def test_states_shared_with_another_thread_are_copied_on_read():
+    parent = make_state()
+    child = parent.copy()
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(hgn_pyhop._on(child, lambda state: state.at, ())))
+    thread.start()
+    thread.join()
+    assert seen == [{'r': 'x', 'p': 'y'}] and vars(child)['at'] is seen[0]
+    seen[0]['r'] = 'z'
+    assert parent.at['r'] == 'x'
@@ -0,0 +1,89 @@
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+class Recorder(hgn_pyhop.Tracer):
+    def __init__(self):
+        self.events = []
+
+    def on_expand(self, depth, goal):
+        self.events.append(('expand', depth, goal))
+
+    def on_satisfied(self, depth, goal):
+        self.events.append(('satisfied', depth, goal))
+
+    def on_copy(self, depth, seconds):
+        self.events.append(('copy', depth))
+
+    def on_operator(self, depth, operator, goal, newstate, seconds):
+        self.events.append(('operator', depth, operator.__name__, bool(newstate)))
+
+    def on_method(self, depth, method, goal, subgoals, seconds):
+        self.events.append(('method', depth, method.__name__, bool(subgoals)))
+
+    def on_backtrack(self, depth):
+        self.events.append(('backtrack', depth))
+
+
+def declare_detour():
+    """The way to town is by the road; the path through the pit leads nowhere."""
+    def step(state, obj, place):
+        if place in state.links[state.at[obj]]:
+            state.at[obj] = place
+            return state
+        return False
+
+    def via(middle):
+        def method(state, obj, place):
+            if state.at[obj] == 'home' and place not in state.links['home']:
+                return [('at', obj, middle), ('at', obj, place)]
+            return False
+        method.__name__ = 'via_' + middle
+        return method
+
+    hgn_pyhop.declare_operators('at', step)
+    hgn_pyhop.declare_methods('at', via('pit'), via('road'))
+    state = State('s')
+    state.at = {'x': 'home'}
+    state.links = {'home': ('pit', 'road'), 'pit': (), 'road': ('town',), 'town': ()}
+    return state, [('at', 'x', 'town'), ('at', 'x', 'town')]
+
+
+def test_tracers_see_the_events_that_stats_count():
+    state, goals = declare_detour()
+    for engine in ('recursive', 'iterative'):
+        stats, tracer = hgn_pyhop.SearchStats(), Recorder()
+        plan = hgn_pyhop.pyhop(state, goals, engine=engine, stats=stats, tracer=tracer)
+        assert plan == [('step', 'x', 'road'), ('step', 'x', 'town')]
+        events = tracer.events
+        assert events[0] == ('expand', 0, goals[0]) and events[-1] == ('expand', 4, None)
+        assert events[1:4] == [('copy', 0), ('operator', 0, 'step', False), ('method', 0, 'via_pit', True)]
+        assert ('backtrack', 2) in events and events[-2] == ('satisfied', 3, goals[1])
+        for index, event in enumerate(events):
+            if event[0] == 'operator':
+                assert events[index - 1] == ('copy', event[1])
+        kinds = [event[0] for event in events]
+        assert kinds.count('expand') == stats.nodes
+        assert kinds.count('backtrack') == stats.backtracks
+        assert kinds.count('satisfied') == stats.satisfied
+        assert kinds.count('copy') == stats.copies
+        assert max(event[1] for event in events if event[0] == 'expand') == stats.max_depth
+        for kind, table in (('operator', stats.operators), ('method', stats.methods)):
+            for name, (calls, succeeded, _) in table.items():
+                called = [event[3] for event in events if event[:1] == (kind,) and event[2] == name]
+                assert (len(called), sum(called)) == (calls, succeeded)
+
+
+def test_searches_without_a_tracer_or_stats_need_no_monitor(monkeypatch):
+    made = []
+
+    class Counted(hgn_pyhop._Monitor):
+        def __init__(self, *args):
+            made.append(self)
+            super().__init__(*args)
+
+    monkeypatch.setattr(hgn_pyhop, '_Monitor', Counted)
+    state, goals = declare_detour()
+    plan = hgn_pyhop.pyhop(state, goals)
+    assert plan and not made
+    assert hgn_pyhop.pyhop(state, goals, tracer=Recorder()) == plan and made
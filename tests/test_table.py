@@ -0,0 +1,78 @@
+import pytest
+
+import hgn_pyhop
+from hgn_pyhop import State
+
+
+def declare_detours():
+    """Two orders of the same steps reach the same dead end before the plan that works."""
+    def tick(state, name, value):
+        if name == 'finish' and not state.ready['x']:
+            return False
+        state.done[name] = value
+        return state
+
+    def get_ready(state, name, value):
+        state.ready[name] = value
+        return state
+
+    def get_stuck(state, name, value):
+        return False
+
+    def via_ab(state, name, value):
+        if name == 'finish':
+            return [('done', 'a', True), ('done', 'b', True), ('stuck', 'x', True)]
+
+    def via_ba(state, name, value):
+        if name == 'finish':
+            return [('done', 'b', True), ('done', 'a', True), ('stuck', 'x', True)]
+
+    def direct(state, name, value):
+        if name == 'finish':
+            return [('ready', 'x', True), ('done', 'finish', True)]
+
+    hgn_pyhop.declare_operators('done', tick)
+    hgn_pyhop.declare_operators('ready', get_ready)
+    hgn_pyhop.declare_operators('stuck', get_stuck)
+    hgn_pyhop.declare_methods('done', via_ab, via_ba, direct)
+    state = State('s')
+    state.done = {'a': False, 'b': False, 'finish': False}
+    state.ready = {'x': False}
+    state.stuck = {'x': False}
+    return state, [('done', 'finish', True)]
+
+
+@pytest.mark.parametrize('options', [{}, {'undo': True}, {'engine': 'iterative'}])
+def test_table_prunes_repeated_failures_without_changing_the_plan(options):
+    state, goals = declare_detours()
+    plan = hgn_pyhop.pyhop(state, goals)
+    assert plan == [('get_ready', 'x', True), ('tick', 'finish', True)]
+    table = hgn_pyhop.TranspositionTable()
+    assert hgn_pyhop.pyhop(state, goals, table=table, **options) == plan
+    assert table.hits > 0 and len(table) > 0
+
+
+def test_table_compares_states_whose_hashes_collide():
+    state, goals = declare_detours()
+    other = state.copy()
+    other.done['a'] = True
+    table = hgn_pyhop.TranspositionTable()
+    table.record_failure(table.key(state, goals))
+    assert table.failed(table.key(state.copy(), goals))
+    collision = (hash(state),) + table.key(other, goals)[1:]
+    assert not table.failed(collision)
+
+
+def test_table_keeps_a_snapshot_of_states_changed_in_place():
+    state, goals = declare_detours()
+    undo = hgn_pyhop.UndoState(state)
+    table = hgn_pyhop.TranspositionTable()
+    mark = undo.mark()
+    key = table.key(undo, goals)
+    undo.done['a'] = True
+    table.record_failure(table.key(undo, goals))
+    undo.rollback(mark)
+    assert not table.failed(key)
+    assert table.failed(table.key(state.copy(), goals)) is False
+    undo.done['a'] = True
+    assert table.failed(table.key(undo, goals))
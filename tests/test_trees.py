@@ -0,0 +1,41 @@
+import io
+
+import pytest
+
+import hgn_pyhop
+
+
+@pytest.fixture
+def trees(logistics, satellite):
+    return [hgn_pyhop.pyhop(state, goals, tree=True) for state, goals in (logistics, satellite)]
+
+
+def test_records_rebuild_the_tree(trees):
+    for tree in trees:
+        records = hgn_pyhop.tree_records(tree)
+        assert hgn_pyhop.tree_from_records(records) == tree
+        assert sum(1 for record in records if record[1] == 'operator') == len(hgn_pyhop.tree_plan(tree))
+
+
+def test_trees_dump_and_load_as_json_lines(trees):
+    file = io.StringIO()
+    hgn_pyhop.dump_trees(trees, file)
+    assert len(file.getvalue().splitlines()) == len(trees)
+    file.seek(0)
+    assert list(hgn_pyhop.load_trees(file)) == trees
+
+
+def test_trees_dump_and_load_as_pickles(trees):
+    file = io.BytesIO()
+    hgn_pyhop.dump_trees(trees, file, format='pickle')
+    file.seek(0)
+    loaded = list(hgn_pyhop.load_trees(file, format='pickle'))
+    assert loaded == trees
+    assert [hgn_pyhop.tree_plan(tree) for tree in loaded] == [hgn_pyhop.tree_plan(tree) for tree in trees]
+
+
+def test_unknown_formats_are_rejected(trees):
+    with pytest.raises(ValueError):
+        hgn_pyhop.dump_trees(trees, io.StringIO(), format='xml')
+    with pytest.raises(ValueError):
+        list(hgn_pyhop.load_trees(io.StringIO(), format='xml'))
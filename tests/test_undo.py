@@ -0,0 +1,81 @@
+import pickle
+
+import hgn_pyhop
+from hgn_pyhop import State, UndoState
+
+
+def sample_state():
+    state = State('s')
+    state.a = {'x': 1}
+    state.b = {1, 2}
+    state.c = 5
+    return state
+
+
+def test_rollback_undoes_every_write_since_the_mark():
+    state = sample_state()
+    undo = UndoState(state)
+    mark = undo.mark()
+    undo.a['x'] = 2
+    undo.a['y'] = 3
+    del undo.a['x']
+    undo.b.add(3)
+    undo.b.discard(1)
+    undo.c = 7
+    undo.d = {'q': 1}
+    undo.d['r'] = 2
+    undo.rollback(mark)
+    assert undo.a == {'x': 1} and undo.b == {1, 2} and undo.c == 5 and not hasattr(undo, 'd')
+    assert state.a == {'x': 1} and state.b == {1, 2}
+    assert hgn_pyhop.state_key(undo) == hgn_pyhop.state_key(state)
+
+
+def test_changed_since_compares_with_the_values_at_the_mark():
+    undo = UndoState(sample_state())
+    mark = undo.mark()
+    assert not undo.changed_since(mark)
+    undo.a['x'] = 2
+    undo.b.add(3)
+    assert undo.changed_since(mark)
+    undo.a['x'] = 1
+    undo.b.discard(3)
+    assert not undo.changed_since(mark)
+    undo.c = 6
+    assert undo.changed_since(mark)
+    undo.c = 5
+    assert not undo.changed_since(mark)
+
+
+def test_undo_states_copy_and_pickle_as_plain_states():
+    state = sample_state()
+    undo = UndoState(state)
+    undo.a['x'] = 2
+    for other in (undo.copy(), pickle.loads(pickle.dumps(undo))):
+        assert type(other) is State and type(other.a) is dict
+        assert other.a == {'x': 2} and hgn_pyhop.state_key(other) == hgn_pyhop.state_key(undo)
+    mark = undo.mark()
+    copied = undo.copy()
+    undo.a['x'] = 3
+    undo.rollback(mark)
+    assert copied.a == {'x': 2}
+
+
+def test_undo_states_hash_and_compare_like_states():
+    state = sample_state()
+    undo = UndoState(state)
+    mark = undo.mark()
+    undo.a['x'] = 2
+    assert undo != state and undo == undo.copy() and hash(undo) == hash(undo.copy())
+    undo.rollback(mark)
+    assert undo == state and hash(undo) == hash(state)
+
+
+def test_undo_search_finds_the_same_plans_and_leaves_the_state_alone(logistics, satellite):
+    for state, goals in (logistics, satellite):
+        before = hgn_pyhop.state_key(state)
+        plan = hgn_pyhop.pyhop(state, goals, undo=True)
+        assert plan
+        tree = hgn_pyhop.pyhop(state, goals, undo=True, tree=True, table=hgn_pyhop.TranspositionTable())
+        assert hgn_pyhop.tree_plan(tree) == plan
+        assert hgn_pyhop.state_key(state) == before
+    assert hgn_pyhop.pyhop(*logistics, undo=True) == hgn_pyhop.pyhop(*logistics, engine='iterative')
@@ -0,0 +1,68 @@
+import pytest
+
+import hgn_pyhop
+
+MISSING = object()
+
+
+def lookup(state, term, x):
+    """A term of a vector_select condition for candidate x, the slow way."""
+    if term == 'x':
+        return x
+    if isinstance(term, tuple):
+        key = lookup(state, term[1], x)
+        return MISSING if key is MISSING else getattr(state, term[0]).get(key, MISSING)
+    return term
+
+
+def holds(state, condition, x):
+    if len(condition) == 2:
+        value = lookup(state, condition[1], x)
+        return value is not MISSING and value in getattr(state, condition[0])
+    value = lookup(state, condition[:2], x)
+    return value is not MISSING and value == lookup(state, condition[2], x)
+
+
+def test_selections_agree_with_a_loop(logistics):
+    pytest.importorskip('numpy')
+    state = logistics[0].copy()
+    package, truck = sorted(state.packages)[0], sorted(state.trucks)[0]
+    state.at[package] = truck  # In a truck, so its location has no city
+    compact = hgn_pyhop.compile_state(state)
+    city = state.in_city[state.at[truck]]
+    for candidates, conditions in [
+            (compact.trucks, [('in_city', ('at', 'x'), city)]),
+            (compact.packages, [('in_city', ('at', 'x'), city)]),
+            (compact.packages, [('trucks', ('at', 'x'))]),
+            (compact.packages, [('in_city', ('at', 'x'), ('in_city', ('at', truck)))]),
+            (compact.airplanes, [('airports', ('at', 'x'))]),
+            (compact.locations, [('at', 'x', 'nowhere')]),
+            (compact.packages | compact.trucks, [('locations', ('at', 'x')), ('in_city', ('at', 'x'), city)]),
+            (compact.trucks, [('in_city', ('at', 'x'), 'atlantis')])]:
+        expected = [x for x in candidates if all(holds(compact, condition, x) for condition in conditions)]
+        assert hgn_pyhop.vector_select(compact, candidates, conditions) == expected, conditions
+    assert hgn_pyhop.vector_select(compact, compact.packages, [('trucks', ('at', 'x'))]) == [package]
+
+
+def test_views_hold_the_value_ids_of_the_objects(logistics):
+    pytest.importorskip('numpy')
+    compact = hgn_pyhop.compile_state(logistics[0])
+    view = hgn_pyhop.vector_view(compact, 'at')
+    assert not view.flags.writeable
+    positions = compact._layout.positions['at']
+    for first in compact.at:
+        for second in compact.at:
+            same = view[positions[first]] == view[positions[second]]
+            assert same == (compact.at[first] == compact.at[second])
+    with pytest.raises(TypeError):
+        hgn_pyhop.vector_view(logistics[0], 'at')
+
+
+def test_vector_functions_need_numpy(monkeypatch, logistics):
+    monkeypatch.setattr(hgn_pyhop, 'numpy', None)
+    compact = hgn_pyhop.compile_state(logistics[0])
+    with pytest.raises(ImportError):
+        hgn_pyhop.vector_view(compact, 'at')
+    with pytest.raises(ImportError):
+        hgn_pyhop.vector_select(compact, compact.trucks, [('trucks', 'x')])
+    assert hgn_pyhop.pyhop(compact, logistics[1]) == hgn_pyhop.pyhop(logistics[0], logistics[1])